@@ -0,0 +1,24 @@
+"""
+Throughput of cleaning_cashflow for synthetic Toshl exports of increasing size.
+Run from the repository root: python -m benchmarks.bench_cleaning_cashflow
+"""
+import time
+from benchmarks.synthetic_data import generate_toshl_export
+from src.datahub.processing_layer import lib_data_operations as pl
+
+
+def main(sizes=(10 ** 4, 10 ** 5, 10 ** 6), repeat=3):
+    print(f"{'transactions':>12} {'best [s]':>10} {'transactions/s':>15}")
+    for n_rows in sizes:
+        df_export = generate_toshl_export(n_rows)
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pl.cleaning_cashflow(df_export)
+            durations.append(time.perf_counter() - start)
+        best = min(durations)
+        print(f"{n_rows:>12} {best:>10.3f} {n_rows / best:>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Scaling of prepare_timeseries with the number of months and holdings of a synthetic savings plan.
+Run from the repository root: python -m benchmarks.bench_prepare_timeseries
+"""
+import time
+from benchmarks.synthetic_data import generate_savings_plan_orders
+from src.datahub.processing_layer import lib_data_operations as pl
+
+
+def main(months=(12, 60, 240, 1200), holdings=(5, 50, 500), repeat=3):
+    print(f"{'months':>7} {'holdings':>9} {'cells':>9} {'best [s]':>10}")
+    for n_months in months:
+        for n_holdings in holdings:
+            df_orders = generate_savings_plan_orders(n_months, n_holdings)
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                pl.prepare_timeseries(df_orders)
+                durations.append(time.perf_counter() - start)
+            print(f"{n_months:>7} {n_holdings:>9} {n_months * n_holdings:>9} {min(durations):>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Benchmark suite of the processing layer: Runs each function on synthetic data of increasing size, records the best
+runtime and the peak memory (tracemalloc) and reports the change against the stored baseline (baselines.json,
+measured on the code base before the processing layer optimizations).
+Run from the repository root:
+    python -m benchmarks.suite                     # print the results and the change against the baseline
+    python -m benchmarks.suite --compare           # same, but exit code 1 on regressions or missing baseline
+    python -m benchmarks.suite --save-baseline     # store the current results as baseline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+from benchmarks import synthetic_data as sd
+from src.datahub.processing_layer import lib_data_operations as pl
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+### Key of the baseline file, that describes where the baseline was measured
+ENVIRONMENT_KEY = "_environment"
+### Scale factor of the input sizes of all cases
+SIZES = {"small": 1, "medium": 10, "large": 100}
+
+
+def _cashflow(scale: int):
+    return pl.cleaning_cashflow(sd.generate_toshl_export(10 ** 4 * scale))
+
+
+def _orders(scale: int):
+    return sd.generate_savings_plan_orders(n_months=12 * scale, n_holdings=20)
+
+
+def _current_prices(scale: int):
+    df_orders = _orders(scale)
+    return pl.preprocess_prices(sd.generate_price_history(df_orders["ISIN"].unique(), n_days=10))
+
+
+### Each case consists of the benchmarked function and a setup function, that creates its arguments for a scale
+CASES = {
+    "cleaning_cashflow": (pl.cleaning_cashflow,
+                          lambda scale: (sd.generate_toshl_export(10 ** 4 * scale),)),
+    "split_cashflow_data": (pl.split_cashflow_data,
+                            lambda scale: (_cashflow(scale),)),
+    "preprocess_cashflow": (pl.preprocess_cashflow,
+                            lambda scale: (pl.split_cashflow_data(_cashflow(scale))[1],)),
+    "combine_incomes": (pl.combine_incomes,
+                        lambda scale: (pl.split_cashflow_data(_cashflow(scale))[0],
+                                       sd.generate_excel_income(100 * scale))),
+    "prepare_timeseries": (pl.prepare_timeseries,
+                           lambda scale: (_orders(scale),)),
+    "get_portfolio_value": (pl.get_portfolio_value,
+                            lambda scale: (_orders(scale), _current_prices(scale))),
+    "compute_crypto_portfolio_value": (pl.compute_crypto_portfolio_value,
+                                       lambda scale: sd.generate_crypto_holdings(n_holdings=50 * scale,
+                                                                                 n_listed=500 * scale)),
+}
+
+
+def measure(function, args: tuple, repeat=3) -> dict:
+    """
+    Measures the best runtime of repeat runs and the peak memory of a separate run of function(*args).
+    :return: dictionary with seconds and peak_mb
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    ### Memory is traced in a separate run, because tracing slows down the execution
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(durations), "peak_mb": peak / 1024 ** 2}
+
+
+def run(cases=None, sizes=None, repeat=3) -> dict:
+    """
+    Runs the given cases for all given sizes.
+    :param cases: list of case names, all cases if None
+    :param sizes: list of size names (see SIZES), all sizes if None
+    :param repeat: number of timed runs per case and size
+    :return: dictionary case:size:measurement, the measurement holds the error instead, if the case failed
+    """
+    results = {}
+    for case in (cases or CASES.keys()):
+        function, setup = CASES[case]
+        results[case] = {}
+        for size in (sizes or SIZES.keys()):
+            try:
+                results[case][size] = measure(function, setup(SIZES[size]), repeat)
+            except Exception as e:
+                results[case][size] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+
+def environment() -> dict:
+    """
+    :return: dictionary describing the code base and the library versions of the current run
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "pandas": pd.__version__,
+            "numpy": np.__version__}
+
+
+def _delta(value: float, reference: float) -> str:
+    return f"{100 * (value / reference - 1):+.0f}%"
+
+
+def compare(results: dict, baseline: dict, tolerance=0.25) -> list:
+    """
+    Prints the results and their relative change against the baseline.
+    :param results: dictionary case:size:measurement of the current run
+    :param baseline: dictionary case:size:measurement of the baseline
+    :param tolerance: relative increase of runtime or peak memory, that is reported as regression
+    :return: list of regressions (case, size, metric, ratio), a failing case has metric "error"
+    """
+    regressions = []
+    print(f"{'case':<32} {'size':<7} {'seconds':>9} {'delta':>7} {'peak [MB]':>10} {'delta':>7}")
+    for case, sizes in results.items():
+        for size, measurement in sizes.items():
+            reference = baseline.get(case, {}).get(size) or {}
+            if "error" in measurement:
+                print(f"{case:<32} {size:<7} FAILED: {measurement['error']}")
+                if "error" not in reference:
+                    regressions.append((case, size, "error", None))
+                continue
+            deltas = {}
+            for metric in ["seconds", "peak_mb"]:
+                if reference.get(metric, 0) > 0:
+                    deltas[metric] = _delta(measurement[metric], reference[metric])
+                    ratio = measurement[metric] / reference[metric]
+                    if ratio > 1 + tolerance:
+                        regressions.append((case, size, metric, ratio))
+                else:
+                    ### No baseline or the baseline code failed for this case
+                    deltas[metric] = "-"
+            print(f"{case:<32} {size:<7} {measurement['seconds']:>9.4f} {deltas['seconds']:>7} "
+                  f"{measurement['peak_mb']:>10.2f} {deltas['peak_mb']:>7}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", choices=list(CASES.keys()), help="cases to run, default: all")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES.keys()), help="sizes to run, default: all")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per case and size")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="path of the baseline file")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--compare", action="store_true",
+                      help="fail (exit code 1) on regressions against the baseline or if there is no baseline")
+    mode.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative increase of runtime or peak memory, that is reported as regression")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+    elif args.compare:
+        parser.error(f"No baseline found at {args.baseline}, store one with --save-baseline")
+    if ENVIRONMENT_KEY in baseline:
+        print(f"Baseline: {baseline[ENVIRONMENT_KEY]}")
+
+    results = run(args.cases, args.sizes, args.repeat)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        ### Keep baselines of cases and sizes, that were not part of this run
+        for case, sizes in results.items():
+            baseline.setdefault(case, {}).update(sizes)
+        baseline[ENVIRONMENT_KEY] = environment()
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print(f"Baseline stored in {args.baseline}")
+        return 0
+    for case, size, metric, ratio in regressions:
+        if metric == "error":
+            print(f"REGRESSION: {case} ({size}): fails, but passed in the baseline")
+        else:
+            print(f"REGRESSION: {case} ({size}): {metric} {_delta(ratio, 1.)} against baseline")
+    return 1 if args.compare and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
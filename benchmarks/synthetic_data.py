@@ -0,0 +1,158 @@
+"""
+Generators of synthetic input data for the processing layer. All generators are deterministic for a given seed
+and produce the same schemata as the real data sources (see README.md).
+"""
+import numpy as np
+import pandas as pd
+
+EXPENSE_TAGS = {
+    "Wohnen": ['rent', 'insurance', 'Miete'],
+    "Essen": ['restaurants', 'Lebensmittel', 'groceries', 'Fast Food', 'Süßigkeiten', 'Kaffee und Tee'],
+    "Transport": ['bus', 'taxi', 'metro', 'Eisenbahn', 'fuel', 'Flugzeug'],
+    "Freizeit": ['training', 'events', 'books', 'music', 'clothes', 'devices'],
+    "Urlaub": ['sightseeing', 'Beherbergung', 'accommodation'],
+}
+INCOME_TAGS = {
+    "Einkommen": ["Salary", "Gehalt Vorschuss", "Reisekosten", "Geschenk", "Investing"],
+}
+
+
+def _format_amounts(amounts: np.ndarray) -> np.ndarray:
+    """
+    Formats amounts like the Toshl export, e.g. 1234.5 --> "1,234.50"
+    """
+    return np.array([f"{amount:,.2f}" for amount in amounts], dtype=object)
+
+
+def generate_toshl_export(n_rows: int, start_date="2016-01-01", income_share=0.05, seed=0) -> pd.DataFrame:
+    """
+    Generates appended monthly Toshl exports (same format as bilanz_full.csv).
+    :param n_rows: number of transactions
+    :param start_date: date of the first transaction, transactions are spread over one day each
+    :param income_share: share of income transactions
+    :param seed: seed of the random generator
+    :return: dataframe with columns of the Toshl export
+    """
+    rng = np.random.default_rng(seed)
+    is_income = rng.random(n_rows) < income_share
+
+    expense_categories = np.array([category for category, tags in EXPENSE_TAGS.items() for _ in tags])
+    expense_tags = np.array([tag for tags in EXPENSE_TAGS.values() for tag in tags])
+    income_categories = np.array([category for category, tags in INCOME_TAGS.items() for _ in tags])
+    income_tags = np.array([tag for tags in INCOME_TAGS.values() for tag in tags])
+    expense_choice = rng.integers(0, len(expense_tags), n_rows)
+    income_choice = rng.integers(0, len(income_tags), n_rows)
+    categories = np.where(is_income, income_categories[income_choice], expense_categories[expense_choice])
+    tags = np.where(is_income, income_tags[income_choice], expense_tags[expense_choice])
+
+    amounts = np.round(np.where(is_income, rng.uniform(100., 5000., n_rows), rng.exponential(30., n_rows)), 2)
+    amounts_str = _format_amounts(amounts)
+    dates = pd.Timestamp(start_date) + pd.to_timedelta(np.sort(rng.integers(0, 365 * 5, n_rows)), unit="D")
+
+    return pd.DataFrame({
+        "Date": dates.strftime("%m/%d/%y"),
+        "Account": "Cash",
+        "Category": categories,
+        "Tags": tags,
+        "Expense amount": np.where(is_income, "0", amounts_str),
+        "Income amount": np.where(is_income, amounts_str, "0"),
+        "Currency": "EUR",
+        "In main currency": amounts_str,
+        "Main currency": "EUR",
+        "Description": "",
+    })
+
+
+def generate_savings_plan_orders(n_months: int, n_holdings: int, start_date="2010-01-01", seed=0) -> pd.DataFrame:
+    """
+    Generates monthly savings-plan executions of n_holdings ETFs over n_months (same format as the output of
+    preprocess_orders): each ETF is bought once per month.
+    :param n_months: number of monthly executions
+    :param n_holdings: number of ETFs in the savings plan
+    :param start_date: date of the first execution
+    :param seed: seed of the random generator
+    :return: dataframe with columns Index, Date, Price, Investment, Ordercost, Depotprovider, Name, ISIN
+    """
+    rng = np.random.default_rng(seed)
+    execution_dates = pd.date_range(start_date, periods=n_months, freq="MS") + pd.Timedelta(days=1)
+    ### Geometric random walk of the price of each ETF
+    returns = rng.normal(0.005, 0.04, (n_months, n_holdings))
+    prices = rng.uniform(20., 200., n_holdings) * np.exp(np.cumsum(returns, axis=0))
+    names = np.array([f"ETF {holding:04d}" for holding in range(n_holdings)], dtype=object)
+    isins = np.array([f"IE{holding:010d}" for holding in range(n_holdings)], dtype=object)
+
+    return pd.DataFrame({
+        "Index": np.repeat(np.arange(1, n_months + 1), n_holdings),
+        "Date": np.repeat(execution_dates.values, n_holdings),
+        "Price": np.round(prices.ravel(), 2),
+        "Investment": np.tile(rng.choice([25., 50., 100., 200.], n_holdings), n_months),
+        "Ordercost": 1.5,
+        "Depotprovider": "Broker",
+        "Name": np.tile(names, n_months),
+        "ISIN": np.tile(isins, n_months),
+    })
+
+
+def generate_excel_income(n_rows: int, start_date="2016-01-01", seed=0) -> pd.DataFrame:
+    """
+    Generates income entries of the income workbook (same format as sheet 0 of income.ods).
+    :param n_rows: number of income entries
+    :param start_date: date of the first entry, entries are spread over five years
+    :param seed: seed of the random generator
+    :return: dataframe with columns Datum, Art, Betrag
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp(start_date) + pd.to_timedelta(np.sort(rng.integers(0, 365 * 5, n_rows)), unit="D")
+    return pd.DataFrame({
+        "Datum": dates.strftime("%d.%m.%Y"),
+        "Art": rng.choice(["Gehalt", "Sodexo", "Reisekosten", "Geschenk"], n_rows),
+        "Betrag": np.round(rng.uniform(50., 4000., n_rows), 2),
+    })
+
+
+def generate_price_history(isins, n_days: int, start_date="2016-01-01", seed=0) -> pd.DataFrame:
+    """
+    Generates daily prices of the given ISINs on business days (same format as the historized ETF prices).
+    :param isins: list of ISINs
+    :param n_days: number of business days
+    :param start_date: first date of the price history
+    :param seed: seed of the random generator
+    :return: dataframe with columns ISIN, Price, Currency, Date (string, format %d.%m.%Y)
+    """
+    rng = np.random.default_rng(seed)
+    isins = np.asarray(isins, dtype=object)
+    dates = pd.bdate_range(start_date, periods=n_days)
+    returns = rng.normal(0.0002, 0.01, (n_days, len(isins)))
+    prices = rng.uniform(20., 200., len(isins)) * np.exp(np.cumsum(returns, axis=0))
+    return pd.DataFrame({
+        "ISIN": np.tile(isins, n_days),
+        "Price": np.round(prices.ravel(), 2),
+        "Currency": "EUR",
+        "Date": np.repeat(dates.strftime("%d.%m.%Y"), len(isins)),
+    })
+
+
+def generate_crypto_holdings(n_holdings: int, n_listed: int, n_exchanges=3, seed=0):
+    """
+    Generates a crypto portfolio and a price list of listed cryptocurrencies (same format as the crypto orders
+    longlist and the output of extract_crypto_prices).
+    :param n_holdings: number of positions (exchange, currency) in the portfolio
+    :param n_listed: number of listed cryptocurrencies in the price list, needs to be >= n_holdings
+    :param n_exchanges: number of exchanges holding the positions
+    :param seed: seed of the random generator
+    :return: tuple (portfolio with columns exchange, currency, amount; prices with columns name, symbol, price)
+    """
+    assert n_listed >= n_holdings, "All held cryptocurrencies need to be listed!"
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"C{listed:05d}" for listed in range(n_listed)], dtype=object)
+    portfolio = pd.DataFrame({
+        "exchange": rng.choice([f"Exchange {exchange}" for exchange in range(n_exchanges)], n_holdings),
+        "currency": rng.choice(symbols, n_holdings, replace=False),
+        "amount": np.round(rng.exponential(10., n_holdings), 6),
+    })
+    prices = pd.DataFrame({
+        "name": np.array([f"Coin {listed:05d}" for listed in range(n_listed)], dtype=object),
+        "symbol": symbols,
+        "price": np.round(rng.lognormal(0., 3., n_listed), 6),
+    })
+    return portfolio, prices
@@ -8,6 +8,8 @@ import dash
 import dash_bootstrap_components as dbc
 from src.datahub.processing_layer import lib_data_operations as pl
 from src.datahub.datahub_crypto.extract_crypto_data import get_current_cryptocurrency_price
+from src.datahub.utilities.fx_rates import FxRates
+from src.dashboard.dashboard_lib.data_handle import VersionedDataHandle, DataRefresher
 
 app = dash.Dash(__name__,
                 title="Finance App",
@@ -17,25 +19,75 @@ app = dash.Dash(__name__,
 server = app.server
 
 ################################ Data Processing for ETF portfolio #####################################################
-(df_etf_init, df_orders_init, df_dividends, df_income_init, df_prices_init, \
-    df_cashflow_init, _, portfolio_crypto) = pl.load_data()
-crypto_prices = get_current_cryptocurrency_price(currency="EUR")
+### Each dataset is computed lazily on first access by a function of the data snapshot, which reads the datasets it
+### depends on as attributes of the snapshot. Tabs only trigger the computation of the data they show.
+### Frames, that are kept in memory, are converted to compact dtypes (categoricals, datetime64) by pl.normalize_dtypes.
+### Prices in other currencies than Euro are converted with the rates of the FX rate store of the datahub.
+FX_RATES = FxRates("/home/chris/Dropbox/Finance/data/datahub/INGEST/fx/transform/ingest_fx_rates.parquet")
 
-df_orders = pl.preprocess_orders(df_orders_init)
-df_prices = pl.preprocess_prices(df_prices_init)
-df_etf = pl.preprocess_etf_masterdata(df_etf_init)
-df_cashflow = pl.cleaning_cashflow(df_cashflow_init)
-(incomes, expenses) = pl.split_cashflow_data(df_cashflow)
-(caution_expenses, df_expenses) = pl.preprocess_cashflow(expenses)
-df_income_total = pl.combine_incomes(incomes, df_income_init)
-(caution_income, df_incomes) = pl.preprocess_cashflow(df_income_total)
+def load_sources(data) -> dict:
+    """
+    Loads all data sources of the dashboard (see pl.load_data).
+    :param data: DataSnapshot
+    :return: dictionary name:raw dataframe
+    """
+    source_names = ["df_etf_init", "df_orders_init", "df_dividends", "df_income_init", "df_prices_init",
+                    "df_cashflow_init", "df_speculation_init", "portfolio_crypto"]
+    return(dict(zip(source_names, pl.load_data())))
 
-orders_etf = pl.enrich_orders(df_orders, df_etf)
-portfolio_monthly = pl.get_current_portfolio(orders_etf)
-portfolio_value = pl.get_portfolio_value(orders_etf, df_prices)
+def split_cashflow(data) -> tuple:
+    """
+    :param data: DataSnapshot
+    :return: tuple of cleaned toshl incomes and expenses
+    """
+    df_cashflow = pl.normalize_dtypes(pl.cleaning_cashflow(data.sources["df_cashflow_init"]), "df_cashflow")
+    return(pl.split_cashflow_data(df_cashflow))
 
-portfolio_crypto_value = pl.compute_crypto_portfolio_value(portfolio_crypto, crypto_prices)
+def prepare_incomes(data):
+    """
+    :param data: DataSnapshot
+    :return: monthly incomes per category of toshl and excel incomes
+    """
+    (incomes, _) = data.cashflow
+    df_income_total = pl.combine_incomes(incomes, data.sources["df_income_init"])
+    (caution_income, df_incomes) = pl.preprocess_cashflow(df_income_total)
+    return(df_incomes)
 
+DATASETS = {
+    "sources": load_sources,
+    "crypto_prices": lambda data: get_current_cryptocurrency_price(
+        currency="EUR", symbols=list(data.sources["portfolio_crypto"]["currency"].unique()), fx_rates=FX_RATES),
+    "df_orders": lambda data: pl.preprocess_orders(data.sources["df_orders_init"]),
+    "df_prices": lambda data: pl.preprocess_prices(data.sources["df_prices_init"], fx_rates=FX_RATES),
+    "df_etf": lambda data: pl.preprocess_etf_masterdata(data.sources["df_etf_init"]),
+    "cashflow": split_cashflow,
+    "df_expenses": lambda data: pl.preprocess_cashflow(data.cashflow[1])[1],
+    "df_incomes": prepare_incomes,
+    "expenses_cube": lambda data: pl.MonthlyCube(data.df_expenses),
+    "incomes_cube": lambda data: pl.MonthlyCube(data.df_incomes),
+    "orders_etf": lambda data: pl.normalize_dtypes(pl.enrich_orders(data.df_orders, data.df_etf), "orders_etf"),
+    "portfolio_monthly": lambda data: pl.get_current_portfolio(data.orders_etf),
+    "portfolio_value": lambda data: pl.get_portfolio_value(data.orders_etf, data.df_prices),
+    "portfolio_crypto_value": lambda data: pl.normalize_dtypes(
+        pl.compute_crypto_portfolio_value(data.sources["portfolio_crypto"], data.crypto_prices),
+        "portfolio_crypto_value"),
+    "df_timeseries": lambda data: pl.normalize_dtypes(pl.prepare_timeseries_incremental(data.df_orders),
+                                                      "df_timeseries"),
+    "df_price_history": lambda data: pl.load_price_history(isins=data.df_orders["ISIN"].unique()),
+    "df_timeseries_daily": lambda data: pl.normalize_dtypes(
+        pl.compute_daily_portfolio_value(data.df_orders, data.df_price_history, fx_rates=FX_RATES),
+        "df_timeseries_daily"),
+}
 
-df_timeseries = pl.prepare_timeseries(df_orders)
+### A new snapshot is swapped in every DATA_REFRESH_INTERVAL seconds by a background thread, all datasets, that were
+### already used, are computed before the swap. The callbacks read the current snapshot (dashboard_data.current())
+DATA_REFRESH_INTERVAL = 30*60
+dashboard_data = VersionedDataHandle(DATASETS)
+data_refresher = DataRefresher(dashboard_data, interval_seconds=DATA_REFRESH_INTERVAL)
+data_refresher.start()
 
+def reload_data():
+    """
+    Reloads all used dashboard data immediately, the memoized callback results of the old data are invalidated.
+    """
+    dashboard_data.refresh()
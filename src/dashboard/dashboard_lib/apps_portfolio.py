@@ -3,8 +3,10 @@ import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output
 import dash_core_components as dcc
 
-### Import app (to define callbacks) and necessary preprocessed data
-from src.dashboard.dashboard_lib.app import app, df_orders, df_timeseries, df_expenses, df_incomes, portfolio_crypto_value
+### Import app (to define callbacks) and the handle of the preprocessed data, each function reads the current
+### snapshot of the data, which is refreshed in the background
+from src.dashboard.dashboard_lib.app import app, dashboard_data
+from src.dashboard.dashboard_lib.callback_cache import memoize_callback
 from src.datahub.processing_layer import lib_data_operations as pl
 from src.dashboard.plotting_lib import lib_dash_plot as dpl
 
@@ -46,7 +48,7 @@ def html_expenses_tab(title="Expenses"):
 
     )
     category_default = "Overall"
-    distinct_categories = sorted(list(df_expenses.columns))
+    distinct_categories = sorted(list(dashboard_data.current().df_expenses.columns))
     distinct_categories.append(category_default)
 
     dropdown_category = dcc.Dropdown(options=[
@@ -64,7 +66,7 @@ def html_expenses_tab(title="Expenses"):
                                ]
                               )
 
-    distinct_months = sorted(list(set([idx for idx in df_expenses.index])))[::-1]
+    distinct_months = sorted(list(set([idx for idx in dashboard_data.current().df_expenses.index])))[::-1]
     month_default = distinct_months[0]
 
     ### Lower panel: Dropdown month
@@ -177,7 +179,7 @@ def html_income_tab(title="Income"):
 
     )
     category_default = "Overall"
-    distinct_categories = sorted(list(df_incomes.columns))
+    distinct_categories = sorted(list(dashboard_data.current().df_incomes.columns))
     distinct_categories.append(category_default)
 
     dropdown_category = dcc.Dropdown(options=[
@@ -297,7 +299,7 @@ def html_portfolio_overview(portfolio,
     portfolio_view = portfolio_view.drop(["cost/a"], axis=1)
 
     all_group_columns = ["Name", "ISIN", "TER%"]+ group_columns
-    portfolio_view = portfolio_view.groupby(all_group_columns).sum()\
+    portfolio_view = portfolio_view.groupby(all_group_columns, observed=True).sum()\
                                     .reset_index().sort_values(cost_column_name, ascending=False)
 
     portfolio_view = portfolio_view[all_group_columns + [cost_column_name]]
@@ -415,7 +417,7 @@ def html_portfolio_timeseries(title="Portfolio Price Trend"):
 
     )
     stock_default = "Overall Portfolio"
-    distinct_stocks = list(df_orders["Name"].drop_duplicates().sort_values())
+    distinct_stocks = list(dashboard_data.current().df_orders["Name"].drop_duplicates().sort_values())
     distinct_stocks.append(stock_default)
 
     dropdown_stocks = dcc.Dropdown(options=[
@@ -424,11 +426,22 @@ def html_portfolio_timeseries(title="Portfolio Price Trend"):
         value=stock_default,
         id="dropdown-stocks"
     )
+    ### Valuation with the buy prices of the monthly orders or with the daily historized market prices
+    dropdown_valuation = dcc.Dropdown(options=[
+        {"label": "Monthly (buy prices)", "value": "monthly"},
+        {"label": "Daily (market prices)", "value": "daily"}
+    ],
+        value="monthly",
+        id="dropdown-valuation"
+    )
     dropdown_panel = html.Div([html.H2("Choose a timeframe"),
                                 dropdown_timespan,
                                  html.Br(),
                                 html.H2("Choose a stock"),
                                  dropdown_stocks,
+                                 html.Br(),
+                                html.H2("Choose a valuation"),
+                                 dropdown_valuation,
                                  html.Br()
                                ]
                              )
@@ -465,20 +478,30 @@ def html_portfolio_timeseries(title="Portfolio Price Trend"):
 
     return(html_page)
 
-def timeseries_chart(timespan, stock_name):
+@memoize_callback()
+def timeseries_chart(timespan, stock_name, valuation="monthly"):
     """
     Function, that displays the content of the graph_panel, which gets filtered by the selected
-    dropdown elements (timespan, stock_name). Shows a linechart of the selected stock for the specified
+    dropdown elements (timespan, stock_name, valuation). Shows a linechart of the selected stock for the specified
     timespan.
     :param timespan: How many months into the past the data should range.
     :param stock_name: Name of stock, that should be displayed
+    :param valuation: "monthly" (valued with buy prices of the orders) or "daily" (valued with market prices)
     :return: linechart HTML element
     """
-    df_date_sorted = pl.filter_portfolio_date(df_timeseries, timespan)
+    data = dashboard_data.current()
+    if valuation == "daily" and len(data.df_timeseries_daily) == 0:
+        ### Without price history the chart falls back to the monthly valuation
+        return(html.Div([html.P("No price history available, the portfolio is valued with buy prices."),
+                         timeseries_chart(timespan, stock_name, "monthly")
+                         ]))
+    df_valuation = data.df_timeseries_daily if valuation == "daily" else data.df_timeseries
+    df_date_sorted = pl.filter_portfolio_date(df_valuation, timespan)
     df_sorted = pl.filter_portfolio_stock(df_date_sorted, stock_name)
 
     return(dpl.plot_stock_linechart(df_sorted))
 
+@memoize_callback()
 def barchart_expenses(timespan, category):
     """
     Displays the content of the main-barchart panel, after filtering by the selected dropdown elements
@@ -487,14 +510,10 @@ def barchart_expenses(timespan, category):
     :param category: Category for which expenses are shown
     :return: barchart HTML element
     """
-    df_date_sorted = pl.filter_portfolio_date(df_expenses.reset_index(), timespan).set_index("Date")
-    if category == "Overall":
-        df_sorted = df_date_sorted.sum(axis=1)
-    else:
-        assert category in df_expenses.columns, "Category not in columns of dataframe!"
-        df_sorted = df_date_sorted[category]
+    df_sorted = dashboard_data.current().expenses_cube.series(timespan, category)
     return(dpl.plot_barchart(df_sorted, "Expenses"))
 
+@memoize_callback()
 def barchart_month(month):
     """
     Displays the content of the barchart of expenses in the selected month.
@@ -502,11 +521,13 @@ def barchart_month(month):
     :return: barchart HTML element
     """
     import pandas as pd
+    df_expenses = dashboard_data.current().df_expenses
     df_month = df_expenses.reset_index()[df_expenses.reset_index()["Date"] == month].set_index("Date").copy()
     df_chart = pd.DataFrame(df_month.stack()).rename(columns={0:"Expenses"}).reset_index()
     df_chart = df_chart[["Tags", "Expenses"]].set_index("Tags")
     return(dpl.plot_barchart(df_chart, title="Expenses", x_axis="Tags"))
 
+@memoize_callback()
 def barchart_income(timespan, category):
     """
     Displays the content of the main-barchart panel, after filtering by the selected dropdown elements
@@ -515,12 +536,7 @@ def barchart_income(timespan, category):
     :param category: Category for which income is shown
     :return: barchart HTML element
     """
-    df_date_sorted = pl.filter_portfolio_date(df_incomes.reset_index(), timespan).set_index("Date")
-    if category == "Overall":
-        df_sorted = df_date_sorted.sum(axis=1)
-    else:
-        assert category in df_incomes.columns, "Category not in columns of dataframe!"
-        df_sorted = df_date_sorted[category]
+    df_sorted = dashboard_data.current().incomes_cube.series(timespan, category)
     return(dpl.plot_barchart(df_sorted, "Income"))
 
 def html_crypto_overview(title="Cryptocurrencies",
@@ -534,10 +550,13 @@ def html_crypto_overview(title="Cryptocurrencies",
     :return: html element of the tab
     """
     ################################ Prepare data for remainder ########################################################
-    ### Prepare KPI content
+    ### Prepare KPI content, the value is shown with the time the crypto prices were extracted (the tab is cached
+    ### until the next data version)
     from datetime import datetime
-    date_today = datetime.now().strftime(format="%Y-%m-%d %H:%M:%S")
-    title_kpi += " (" + date_today + ")"
+    data = dashboard_data.current()
+    portfolio_crypto_value = data.portfolio_crypto_value
+    date_prices = datetime.fromtimestamp(data.computed_at("crypto_prices")).strftime(format="%Y-%m-%d %H:%M:%S")
+    title_kpi += " (" + date_prices + ")"
     total_value = portfolio_crypto_value[portfolio_crypto_value["exchange"] == "Overall"]["value"].sum()
     value_show = str(round(total_value, 2)) + " €"
 
@@ -613,17 +632,19 @@ def html_crypto_overview(title="Cryptocurrencies",
 # all callbacks need to be defined when the app is started!
 @app.callback(Output('timeseries-chart', 'children'),
               [Input('dropdown-timespan', 'value'),
-                Input('dropdown-stocks', 'value')
+                Input('dropdown-stocks', 'value'),
+                Input('dropdown-valuation', 'value')
                ]
               )
-def dropdown_timeseries_chart(timespan: int, stock_name: str):
+def dropdown_timeseries_chart(timespan: int, stock_name: str, valuation: str):
     """
     Get the content element for the timeseries chart for the given dropdown selection.
     :param timespan: Amount of months into past, that should be visible in the plot
     :param stock_name: name of stock to show in the timeseries plot
+    :param valuation: "monthly" or "daily" valuation of the portfolio
     :return: html element of a timeseries plot
     """
-    html_div = timeseries_chart(timespan, stock_name)
+    html_div = timeseries_chart(timespan, stock_name, valuation)
     return (html_div)
 
 @app.callback(Output('main-barchart', 'children'),
@@ -653,13 +674,7 @@ def dropdown_expenses_average(timespan: int, category: str):
     :param stock_name: name of stock to show in the timeseries plot
     :return: html element of a timeseries plot
     """
-    df_date_sorted = pl.filter_portfolio_date(df_expenses.reset_index(), timespan).set_index("Date")
-    if category == "Overall":
-        df_sorted = df_date_sorted.sum(axis=1)
-    else:
-        assert category in df_expenses.columns, "Category not in columns of dataframe!"
-        df_sorted = df_date_sorted[category]
-    average = -df_sorted.mean()
+    average = -dashboard_data.current().expenses_cube.average(timespan, category)
     html_div = html.B(f"{average:.2f} €")
     return (html_div)
 
@@ -702,18 +717,13 @@ def dropdown_income_average(timespan: int, category: str):
     :param stock_name: name of stock to show in the timeseries plot
     :return: html element of a timeseries plot
     """
-    df_date_sorted = pl.filter_portfolio_date(df_incomes.reset_index(), timespan).set_index("Date")
-    if category == "Overall":
-        df_sorted = df_date_sorted.sum(axis=1)
-    else:
-        assert category in df_incomes.columns, "Category not in columns of dataframe!"
-        df_sorted = df_date_sorted[category]
-    average = df_sorted.mean()
+    average = dashboard_data.current().incomes_cube.average(timespan, category)
     html_div = html.B(f"{average:.2f} €")
     return (html_div)
 
 @app.callback(Output('crypto-dataframe', 'children'),
               Input('dropdown-crypto-exchange', 'value'))
+@memoize_callback()
 def dropdown_crypto_exchange(exchange: str):
     """
     Render crypto-exchange dropdown to filter to dataframe, that should be displayed, for the overall portfolio
@@ -721,6 +731,7 @@ def dropdown_crypto_exchange(exchange: str):
     :param exchange: Name of exchange
     :return: HTML element of the filtered dataframe to display
     """
+    portfolio_crypto_value = dashboard_data.current().portfolio_crypto_value
     df_crypto_show = portfolio_crypto_value[portfolio_crypto_value["exchange"] == exchange]
     df_crypto_show = df_crypto_show[["exchange", "currency", "name", "amount", "value"]]\
                                     .sort_values("value",ascending=False)
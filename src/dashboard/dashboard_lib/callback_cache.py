@@ -0,0 +1,130 @@
+"""
+Memoization of dash callbacks: Results of a callback are cached per input values and per data version. As soon as
+the dashboard data is reloaded (bump_data_version), all cached results of the old data version are dropped.
+"""
+import logging
+import threading
+import functools
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_data_version = 0
+_data_version_lock = threading.Lock()
+_registry = {}
+
+
+def get_data_version() -> int:
+    """
+    :return: version of the currently loaded dashboard data
+    """
+    return _data_version
+
+
+def bump_data_version() -> int:
+    """
+    Marks the dashboard data as reloaded, all memoized callback results become invalid.
+    :return: new data version
+    """
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+        return _data_version
+
+
+class CallbackCache:
+    """
+    Thread-safe bounded LRU cache of callback results, that belongs to a single data version.
+    """
+    def __init__(self, maxsize=128, version_function=get_data_version):
+        """
+        :param maxsize: maximum number of cached results
+        :param version_function: function returning the current data version, which is part of each key
+        """
+        self.maxsize = maxsize
+        self.version_function = version_function
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: hashable key of the input values
+        :return: tuple (found, result)
+        """
+        version = self.version_function()
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, result, version):
+        """
+        Stores result, if it was computed with the current data version.
+        :param key: hashable key of the input values
+        :param result: result of the callback
+        :param version: data version, that was valid when the computation started
+        """
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> dict:
+        """
+        :return: dictionary with hits, misses, current size and maxsize of the cache
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+def memoize_callback(maxsize=128, version_function=get_data_version):
+    """
+    Decorator, that memoizes the results of a callback per input values and data version. All arguments of the
+    callback need to be hashable. When used together with app.callback, it has to be the inner decorator.
+    :param maxsize: maximum number of cached results of the callback
+    :param version_function: function returning the current data version
+    :return: decorator
+    """
+    def decorator(function):
+        cache = CallbackCache(maxsize, version_function)
+        _registry[function.__qualname__] = cache
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            version = version_function()
+            found, result = cache.get(key)
+            if found:
+                logger.debug(f"CACHE: {function.__qualname__}{args} served from cache")
+                return result
+            result = function(*args, **kwargs)
+            cache.put(key, result, version)
+            return result
+
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+def cache_stats() -> dict:
+    """
+    :return: dictionary function name:cache info (hits, misses, size, maxsize) of all memoized callbacks
+    """
+    return {name: cache.info() for name, cache in _registry.items()}
@@ -0,0 +1,151 @@
+"""
+Versioned access to the dashboard data: Each version of the data is a snapshot, whose datasets are computed lazily
+on first access. New snapshots are built by a background thread and swapped in as a whole, callbacks always read
+a consistent version of the data.
+"""
+import time
+import logging
+import threading
+from src.dashboard.dashboard_lib.callback_cache import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+
+class DataSnapshot:
+    """
+    Lazily computed datasets of one data version, the datasets are available as attributes. Each dataset is computed
+    at most once (single-flight): Concurrent readers of a dataset wait for the thread computing it.
+    """
+    def __init__(self, datasets: dict, version: int):
+        """
+        :param datasets: dictionary name:function, each function gets the snapshot and returns the dataset
+        :param version: data version of the snapshot
+        """
+        self._datasets = datasets
+        self._values = {}
+        self._computed_at = {}
+        self._locks = {name: threading.Lock() for name in datasets}
+        self.version = version
+        self.created_at = time.time()
+
+    def get(self, name: str):
+        """
+        Returns the dataset name, computes it, if it was not accessed before.
+        :param name: name of the dataset
+        :return: dataset
+        """
+        if name in self._values:
+            return self._values[name]
+        if name not in self._datasets:
+            raise AttributeError(f"Dataset {name} is not part of the dashboard data!")
+        with self._locks[name]:
+            if name not in self._values:
+                start = time.perf_counter()
+                self._values[name] = self._datasets[name](self)
+                self._computed_at[name] = time.time()
+                logger.info(f"LOAD: Dataset {name} of data version {self.version} computed in "
+                            f"{time.perf_counter() - start:.2f} s")
+        return self._values[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def computed_at(self, name: str) -> float:
+        """
+        :param name: name of the dataset
+        :return: time (seconds since the epoch), when the dataset was computed, the dataset is computed if necessary
+        """
+        self.get(name)
+        return self._computed_at[name]
+
+    def computed(self) -> list:
+        """
+        :return: names of all datasets, that are already computed
+        """
+        return list(self._values.keys())
+
+
+class VersionedDataHandle:
+    """
+    Holds the current DataSnapshot. A refresh builds a new snapshot without blocking readers and replaces the
+    reference to the current snapshot atomically afterwards.
+    """
+    def __init__(self, datasets: dict):
+        """
+        :param datasets: dictionary name:function, each function gets the snapshot and returns the dataset
+        """
+        self.datasets = datasets
+        self._snapshot = DataSnapshot(datasets, version=1)
+        self._refresh_lock = threading.Lock()
+
+    def current(self) -> DataSnapshot:
+        """
+        :return: the current DataSnapshot
+        """
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        """
+        :return: version of the current snapshot
+        """
+        return self._snapshot.version
+
+    def refresh(self, warm=None) -> DataSnapshot:
+        """
+        Builds a new snapshot and swaps it in. The datasets in warm are computed before the swap, so that readers
+        never wait for them. Concurrent refreshes are executed one after the other.
+        :param warm: names of datasets to compute before the swap, default: all datasets computed in the current
+                     snapshot
+        :return: the new DataSnapshot
+        """
+        with self._refresh_lock:
+            start = time.perf_counter()
+            warm = self._snapshot.computed() if warm is None else warm
+            snapshot = DataSnapshot(self.datasets, version=self.version + 1)
+            for name in warm:
+                snapshot.get(name)
+            ### Swap the snapshot before the data version is bumped, so that no callback result of the old data
+            ### is cached under the new version
+            self._snapshot = snapshot
+            bump_data_version()
+            logger.info(f"LOAD: Dashboard data version {snapshot.version} with {len(warm)} precomputed datasets "
+                        f"swapped in after {time.perf_counter() - start:.2f} s")
+            return snapshot
+
+
+class DataRefresher(threading.Thread):
+    """
+    Daemon thread, that refreshes a VersionedDataHandle every interval_seconds, the first refresh is done after
+    interval_seconds. If a refresh fails, the current snapshot is kept and the refresh is retried after
+    retry_seconds.
+    """
+    def __init__(self, handle: VersionedDataHandle, interval_seconds=30*60, retry_seconds=60):
+        """
+        :param handle: VersionedDataHandle to refresh
+        :param interval_seconds: time in seconds between two successful refreshes
+        :param retry_seconds: time in seconds until a failed refresh is retried
+        """
+        super().__init__(name="DataRefresher", daemon=True)
+        self.handle = handle
+        self.interval_seconds = interval_seconds
+        self.retry_seconds = retry_seconds
+        self._stop_event = threading.Event()
+
+    def run(self):
+        wait_seconds = self.interval_seconds
+        while not self._stop_event.wait(wait_seconds):
+            try:
+                self.handle.refresh()
+                wait_seconds = self.interval_seconds
+            except Exception:
+                logger.exception(f"LOAD: Refresh of dashboard data failed, retry in {self.retry_seconds} s")
+                wait_seconds = self.retry_seconds
+
+    def stop(self):
+        """
+        Stops the thread after the currently running refresh.
+        """
+        self._stop_event.set()
@@ -2,9 +2,10 @@ import dash_html_components as html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output
 
-### Import app and dataframes containing data to display to call necessary functions and define callbacks
-from src.dashboard.dashboard_lib.app import app, portfolio_monthly, portfolio_value
+### Import app and the handle of the data to display to call necessary functions and define callbacks
+from src.dashboard.dashboard_lib.app import app, dashboard_data
 from src.dashboard.dashboard_lib import apps_portfolio
+from src.dashboard.dashboard_lib.callback_cache import memoize_callback
 
 ##################################### Define Dash App layout ###########################################################
 
@@ -30,8 +31,10 @@ body = [dbc.CardHeader(tab_nav_bar),
 
 app.layout = dbc.Card(body)
 
+### Built layouts are cached per tab, the cache is invalidated as soon as the data is reloaded (new data version)
 @app.callback(Output('tab-content', 'children'),
               Input('tab-navbar', 'active_tab'))
+@memoize_callback(maxsize=len(tab_nav_bar.children))
 def switch_tabs(tab):
     if tab == "tab-expenses":
         html_div = apps_portfolio.html_expenses_tab()
@@ -44,7 +47,7 @@ def switch_tabs(tab):
         compute_cols = ["Investment", "Investment", "Investment", "Investment"]
         agg_functions = ["sum", "sum", "sum", "sum"]
         # This function is called explicitly with data, because it is reused
-        html_div = apps_portfolio.html_portfolio_overview(portfolio_monthly,
+        html_div = apps_portfolio.html_portfolio_overview(dashboard_data.current().portfolio_monthly,
                                                           group_cols,
                                                           compute_cols,
                                                           agg_functions
@@ -55,7 +58,7 @@ def switch_tabs(tab):
         compute_cols = ["Value", "Value", "Value", "Value"]
         agg_functions = ["sum", "sum", "sum", "sum"]
         # This function is called explicitly with data, because it is reused
-        html_div = apps_portfolio.html_portfolio_overview(portfolio_value,
+        html_div = apps_portfolio.html_portfolio_overview(dashboard_data.current().portfolio_value,
                                                           group_cols,
                                                           compute_cols,
                                                           agg_functions,
@@ -1,59 +1,156 @@
 import json
-import requests
+import time
+import logging
 import pandas as pd
-from bs4 import BeautifulSoup
+from operator import itemgetter
+from bs4 import BeautifulSoup, SoupStrainer
+from ..utilities.fetch_engine import fetch_pages
+from ..utilities.fx_rates import default_fx_rates
 
+logger = logging.getLogger(__name__)
 
-def extract_crypto_prices(num_pages=5) -> pd.DataFrame:
+CRYPTO_BASE_URL = "https://www.coinmarketcap.com/"
+### Keys of the listing data, that are parsed, and their column names
+CRYPTO_KEYS = {"name": "name",
+               "symbol": "symbol",
+               "quote.USD.price": "price",
+               "quote.USD.volume24h": "volume_24h",
+               "quote.USD.percentChange1h": "change_%_1h",
+               "quote.USD.percentChange24h": "change_%_24h",
+               "quote.USD.percentChange7d": "change_%_7d"
+               }
+### Only the script holding the page data is parsed
+NEXT_DATA_STRAINER = SoupStrainer("script", id="__NEXT_DATA__")
+### Symbols, that were not found in the listing, and the time of the search: They are not searched again until
+### unresolved_ttl seconds passed
+_unresolved_searched_at = {}
+
+
+def build_crypto_page_url(page: int) -> str:
     """
-    Scrape current price of cryptocurrencies from https://www.coinmarketcap.com/ and convert it to Euro.
-    :param num_pages: Each page holds 100 cryptos with highest capitalization per default.
-    :return: dataframe with Euro-price of cryptocurrency with name and symbol (ticker)
-    """
-    base_url = "https://www.coinmarketcap.com/"
-
-    # website has several pages of 100 cryptos each
-    for page in range(num_pages):
-        url = base_url if page == 0 else base_url + "?page=" + str(page+1)
-        r = requests.get(url)
-        assert r.status_code == requests.codes.ok, f"Bad request to {url}!"
-        html = r.content.decode("utf-8")
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # Thx to  https://towardsdatascience.com/web-scraping-crypto-prices-with-python-41072ea5b5bf
-        # for the tip of using the script part of the website:
-        data = json.loads(soup.find("script", id="__NEXT_DATA__", type="application/json").contents[0])
-        price_data = json.loads(data["props"]["initialState"])["cryptocurrency"]["listingLatest"]["data"]
-        key_ordering = price_data[0]["keysArr"]
-        price_array = price_data[1:]
-
-        # Create a key-map used to parse the response-json
-        key_map = {}
-        keys_to_parse = {"name": "name",
-                         "symbol": "symbol",
-                         "quote.USD.price": "price",
-                         "quote.USD.volume24h": "volume_24h",
-                         "quote.USD.percentChange1h": "change_%_1h",
-                         "quote.USD.percentChange24h": "change_%_24h",
-                         "quote.USD.percentChange7d": "change_%_7d"
-                         }
-        for idx, key in enumerate(key_ordering):
-            # json structure: price_data = list({"keysArr":[holds key names], "id": str, "excludeProps": []},
-            # [data coin 1], [data coin 2],...)
-            # idx is the index for the key-name in the json
-            if key in keys_to_parse.keys():
-                key_map[idx] = key
-        ## Parse coin data
-        coin_data = {key_map[key]: [] for key, _ in key_map.items()}
-        for coin_kpis in price_array:
-            for idx, entry in enumerate(coin_kpis):
-                if idx in key_map.keys():
-                    coin_data[key_map[idx]].append(coin_kpis[idx])
-        if page == 0:
-            df_prices = pd.DataFrame(coin_data).rename(columns=keys_to_parse)
-        else:
-            df_coin = pd.DataFrame(coin_data).rename(columns=keys_to_parse)
-            df_prices = df_prices.append(df_coin, ignore_index=True)
+    :param page: number of the page (starting with 1)
+    :return: url of the page of coinmarketcap
+    """
+    return CRYPTO_BASE_URL if page == 1 else CRYPTO_BASE_URL + "?page=" + str(page)
+
+
+def parse_crypto_listing(html: str) -> pd.DataFrame:
+    """
+    Parses the listing of cryptocurrencies of a coinmarketcap page.
+    :param html: html content of the page
+    :return: dataframe with the columns of CRYPTO_KEYS (USD prices), symbol MIOTA is renamed to IOTA
+    """
+    soup = BeautifulSoup(html, 'html.parser', parse_only=NEXT_DATA_STRAINER)
+    # Thx to  https://towardsdatascience.com/web-scraping-crypto-prices-with-python-41072ea5b5bf
+    # for the tip of using the script part of the website:
+    data = json.loads(soup.find("script", id="__NEXT_DATA__", type="application/json").contents[0])
+    price_data = json.loads(data["props"]["initialState"])["cryptocurrency"]["listingLatest"]["data"]
+    # json structure: price_data = list({"keysArr":[holds key names], "id": str, "excludeProps": []},
+    # [data coin 1], [data coin 2],...)
+    if len(price_data) == 0:
+        return pd.DataFrame(columns=list(CRYPTO_KEYS.values()))
+    key_ordering = price_data[0]["keysArr"]
+    ### Positions of the needed keys in each coin array, the values are picked with a single itemgetter per coin
+    positions = [idx for idx, key in enumerate(key_ordering) if key in CRYPTO_KEYS]
+    columns = [CRYPTO_KEYS[key_ordering[idx]] for idx in positions]
+    if len(positions) == 1:
+        rows = [(coin_kpis[positions[0]],) for coin_kpis in price_data[1:]]
+    else:
+        get_values = itemgetter(*positions)
+        rows = [get_values(coin_kpis) for coin_kpis in price_data[1:]]
+    df_listing = pd.DataFrame.from_records(rows, columns=columns)
     ## rename IOTA symbol to get in line with exchange-namings
-    df_prices["symbol"] = df_prices["symbol"].str.replace("MIOTA", "IOTA")
-    return df_prices
\ No newline at end of file
+    df_listing["symbol"] = df_listing["symbol"].str.replace("MIOTA", "IOTA")
+    return df_listing
+
+
+def _fetch_listings(pages: list, max_workers: int, requests_per_second: float, cache, ttl) -> list:
+    """
+    Fetches and parses the given pages concurrently.
+    :return: list of parsed listings (see parse_crypto_listing) in the order of pages
+    """
+    urls = {page: build_crypto_page_url(page) for page in pages}
+    contents, failures = fetch_pages(urls, max_workers=max_workers, requests_per_second=requests_per_second,
+                                     cache=cache, ttl=ttl)
+    assert len(failures) == 0, f"Bad request to {[urls[page] for page in failures]}!"
+    return [parse_crypto_listing(contents[page]) for page in pages]
+
+
+def extract_crypto_prices(num_pages=5, max_workers=8, requests_per_second=2., cache=None, ttl=0,
+                          symbols=None, max_pages=5, unresolved_ttl=24*3600) -> pd.DataFrame:
+    """
+    Scrape current price of cryptocurrencies from https://www.coinmarketcap.com/ (in US-Dollar).
+    Without symbols, the first num_pages pages are fetched concurrently. With symbols, pages are fetched in
+    growing batches (1, 2, 4, ... up to max_workers pages) until all symbols are found, the listing ends or
+    max_pages is reached. Symbols, that are not found, are logged and stored in df.attrs["unresolved_symbols"], they
+    are not searched again for unresolved_ttl seconds.
+    :param num_pages: Each page holds 100 cryptos with highest capitalization per default.
+    :param max_workers: maximum number of concurrent requests
+    :param requests_per_second: maximum number of requests started per second
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of cached pages in seconds
+    :param symbols: list of symbols (tickers) to extract, e.g. the held cryptocurrencies, all coins of num_pages if None
+    :param max_pages: maximum number of pages searched for symbols
+    :param unresolved_ttl: time in seconds, a symbol that was not found is not searched again
+    :return: dataframe with price of cryptocurrency with name and symbol (ticker), with symbols only the coin
+             with the highest capitalization per symbol
+    """
+    if symbols is None:
+        # website has several pages of 100 cryptos each
+        listings = _fetch_listings(list(range(1, num_pages + 1)), max_workers, requests_per_second, cache, ttl)
+        return pd.concat(listings, ignore_index=True, sort=False)
+
+    now = time.time()
+    known_unresolved = {symbol for symbol in symbols
+                        if now - _unresolved_searched_at.get(symbol, -float("inf")) < unresolved_ttl}
+    if len(known_unresolved) > 0:
+        logger.info(f"EXTRACT: CRYPTO: Symbols not found in a previous search are skipped: {sorted(known_unresolved)}")
+    searched_symbols = set(symbols) - known_unresolved
+    unresolved = set(searched_symbols)
+    listings = []
+    page, batch_size = 1, 1
+    while len(unresolved) > 0 and page <= max_pages:
+        batch = list(range(page, min(page + batch_size, max_pages + 1)))
+        end_of_listing = False
+        for df_listing in _fetch_listings(batch, max_workers, requests_per_second, cache, ttl):
+            if len(df_listing) == 0:
+                end_of_listing = True
+                break
+            listings.append(df_listing[df_listing["symbol"].isin(searched_symbols)])
+            unresolved -= set(df_listing["symbol"])
+        if end_of_listing:
+            break
+        page += len(batch)
+        batch_size = min(2 * batch_size, max_workers)
+    logger.info(f"EXTRACT: CRYPTO: {len(searched_symbols) - len(unresolved)} of {len(searched_symbols)} symbols found "
+                f"on {page - 1} pages")
+    if len(unresolved) > 0:
+        logger.warning(f"EXTRACT: CRYPTO: Symbols not found: {sorted(unresolved)}")
+    for symbol in unresolved:
+        _unresolved_searched_at[symbol] = now
+    unresolved |= known_unresolved
+
+    df_prices = pd.concat(listings, ignore_index=True, sort=False) if len(listings) > 0 else \
+        pd.DataFrame(columns=list(CRYPTO_KEYS.values()))
+    df_prices = df_prices.drop_duplicates("symbol").reset_index(drop=True)
+    df_prices.attrs["unresolved_symbols"] = sorted(unresolved)
+    return df_prices
+
+
+def get_current_cryptocurrency_price(currency="EUR", symbols=None, num_pages=5, cache=None, ttl=0,
+                                     fx_rates=None) -> pd.DataFrame:
+    """
+    Extracts the current prices of cryptocurrencies in the given currency.
+    :param currency: currency of the prices, e.g. "EUR" or "USD"
+    :param symbols: list of symbols (tickers) to extract, all coins of num_pages if None (see extract_crypto_prices)
+    :param num_pages: number of pages to extract, if no symbols are given, else maximum number of pages searched
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of cached responses in seconds
+    :param fx_rates: FxRates used for the conversion, default: process-wide FxRates of cache and ttl
+    :return: dataframe with price of cryptocurrency with name and symbol (ticker) in the given currency
+    """
+    df_prices = extract_crypto_prices(num_pages=num_pages, cache=cache, ttl=ttl, symbols=symbols, max_pages=num_pages)
+    if currency != "USD":
+        fx_rates = default_fx_rates(cache, ttl) if fx_rates is None else fx_rates
+        df_prices = fx_rates.convert(df_prices, ["price", "volume_24h"], currency, from_currency="USD")
+    return df_prices
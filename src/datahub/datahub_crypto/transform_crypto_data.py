@@ -1,11 +1,35 @@
+import logging
 import pandas as pd
+from datetime import date
 from ..utilities.utils import save_data
-from ..datahub_stocks.extract_stocks_data import extract_conversion_rate_usDollar_euro
+from ..utilities.partitioned_store import PartitionedStore
+from ..utilities.fx_rates import default_fx_rates
 
+logger = logging.getLogger(__name__)
 
-def transform_crypto_prices(df_prices: pd.DataFrame, out_path: str, currency="EUR"):
-    if currency == "EUR":
-        conversion_rate = extract_conversion_rate_usDollar_euro(dollar_to_euro=True)
-        df_prices["price"] = df_prices["price" ] * conversion_rate
-        df_prices["volume_24h"] = df_prices["volume_24h"] * conversion_rate
+
+def transform_crypto_prices(df_prices: pd.DataFrame, out_path: str, currency="EUR", cache=None, ttl=0,
+                            history_path=None, fx_rates=None):
+    """
+    Converts the extracted crypto prices into currency and saves them. Optionally, the prices are appended as daily
+    snapshot to the crypto price history.
+    :param df_prices: extracted prices (see extract_crypto_prices) in US-Dollar
+    :param out_path: path of the current prices
+    :param currency: currency of the saved prices, e.g. "EUR" or "USD"
+    :param cache: HttpCache used for the conversion rate request, no caching if None
+    :param ttl: time to live of the cached conversion rate in seconds
+    :param history_path: root directory of the crypto price history store, no historization if None
+    :param fx_rates: FxRates used for the conversion, default: process-wide FxRates of cache and ttl
+    """
+    if currency != "USD":
+        fx_rates = default_fx_rates(cache, ttl) if fx_rates is None else fx_rates
+        df_prices = fx_rates.convert(df_prices, ["price", "volume_24h"], currency, from_currency="USD")
     save_data(df_prices, out_path)
+
+    if history_path is not None:
+        df_snapshot = df_prices.copy()
+        df_snapshot["currency"] = currency
+        df_snapshot["Date"] = date.today().strftime("%d.%m.%Y")
+        written_dates = PartitionedStore(history_path, index_column="symbol").append(df_snapshot)
+        if len(written_dates) == 0:
+            logger.warning("INGEST: CRYPTO: Price data for this date already exists! No update done!")
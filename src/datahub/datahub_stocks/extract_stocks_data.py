@@ -1,69 +1,169 @@
-import json
+import time
 import logging
-import requests
 import pandas as pd
-from datetime import date
-from ..datahub_stocks.stocks_lib import parse_etf_prices, parse_etf_master_data
+from ..datahub_stocks.stocks_lib import build_etf_soup, parse_etf_prices, parse_etf_master_data
+from ..utilities.fetch_engine import fetch_pages
+from ..utilities.fx_rates import default_fx_rates
 
 logger = logging.getLogger(__name__)
 
 
-def extract_conversion_rate_usDollar_euro(dollar_to_euro=True) -> float:
+def extract_conversion_rate_usDollar_euro(dollar_to_euro=True, cache=None, ttl=0, fx_rates=None) -> float:
     """
-    Uses https://www.finanzen.net to convert US-dollars $ to Euro € and vice versa.
+    Uses https://www.finanzen.net to convert US-dollars $ to Euro € and vice versa. The current rate is memoized
+    (see FxRates), repeated calls do not request it again.
     :param dollar_to_euro: boolean flag, whether to convert dollars to euro
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of a cached conversion rate in seconds
+    :param fx_rates: FxRates used to look up the rate, default: process-wide FxRates of cache and ttl
     :return: conversion rate
     """
-    date_today = date.today().strftime(format="%Y-%m-%d")
+    fx_rates = default_fx_rates(cache, ttl) if fx_rates is None else fx_rates
     if dollar_to_euro == True:
-        url = f"https://www.finanzen.net/ajax/currencyConverter_Exchangerate/USD/EUR/{date_today}"
-    else:
-        url = f"https://www.finanzen.net/ajax/currencyConverter_Exchangerate/EUR/USD/{date_today}"
+        return fx_rates.rate("USD", "EUR")
+    return fx_rates.rate("EUR", "USD")
 
-    r = requests.post(url)
-    assert r.status_code == requests.codes.ok, "Could not convert $ to €!"
-    conversion = float(json.loads(r.content)[0])
 
-    return conversion
+def build_etf_overview_url(source_url: str, isin: str) -> str:
+    """
+    Builds the URL of the justetf.com overview page of a single stock.
+    :param source_url: base url of the justetf.com etf profile
+    :param isin: ISIN of the stock
+    :return: url of the overview page
+    """
+    return source_url + f"?query={isin}&groupField=index&from=search&isin={isin}#overview"
 
 
-def extract_etf_master_data(isin_list: list, source_url: str):
+def fetch_etf_overview_pages(isin_list: list, source_url: str, max_workers=8, requests_per_second=2.,
+                             cache=None, ttl=0):
     """
-    Extracts all masterdata for all stocks in isin_list from justetf.com.
-    :param isin_list: List of ISINs for which master data should be extracted.
-    :return: list of dictionaries of master data
+    Fetches the justetf.com overview page of each ISIN exactly once.
+    :param isin_list: list of ISINs, duplicates are fetched only once
+    :param source_url: base url of the justetf.com etf profile
+    :param max_workers: maximum number of concurrent requests
+    :param requests_per_second: maximum number of requests per second against justetf.com
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of cached pages in seconds, either a single value or a dictionary ISIN:ttl
+    :return: tuple of dictionaries (ISIN:HTML, ISIN:error message)
+    """
+    urls = {isin: build_etf_overview_url(source_url, isin) for isin in isin_list}
+    return fetch_pages(urls, max_workers=max_workers, requests_per_second=requests_per_second,
+                       cache=cache, ttl=ttl)
+
+
+def _parse_pages(pages: dict, parse_functions: dict, parser="lxml"):
+    """
+    Builds the DOM tree of each page once and runs all parse functions on the same tree. The ISIN is added to
+    each parsed dictionary. Pages, which cannot be parsed, are collected with their error message.
+    :param pages: dictionary ISIN:HTML of justetf.com overview page
+    :param parse_functions: dictionary name:function, each function returns a dictionary from a BeautifulSoup object
+    :param parser: parser backend used to build the DOM tree
+    :return: tuple of dictionaries name:{ISIN:parsed dictionary}, name:{ISIN:error message}
+    """
+    parsed = {name: {} for name in parse_functions}
+    errors = {name: {} for name in parse_functions}
+    start = time.perf_counter()
+    for isin, html in pages.items():
+        soup_base = build_etf_soup(html, parser=parser)
+        for name, parse_function in parse_functions.items():
+            try:
+                stock_dict = parse_function(soup_base)
+            except (AssertionError, IndexError, ValueError) as e:
+                logger.warning(f"EXTRACT: JUST-ETF: Parsing {name} failed for {isin}: {e}")
+                errors[name][isin] = f"Parsing failed: {e}"
+                continue
+            stock_dict["ISIN"] = isin
+            parsed[name][isin] = stock_dict
+    if len(pages) > 0:
+        duration = time.perf_counter() - start
+        logger.info(f"EXTRACT: JUST-ETF: Parsed {len(pages)} pages with {parser} in {duration:.2f} s "
+                    f"({duration / len(pages) * 1000:.1f} ms per page)")
+    return parsed, errors
+
+
+def _to_dataframe(parsed: dict, isin_list: list, failures: dict, description: str) -> pd.DataFrame:
     """
-    stock_list = []
-    for isin in isin_list:
-        url = source_url + f"?query={isin}&groupField=index&from=search&isin={isin}#overview"
-        r = requests.get(url)
-        assert r.status_code == 200, "EXTRACT: JUST-ETF: HTTP Error, {}".format(r.status_code)
+    Converts the parsed dictionaries to a dataframe in the order of isin_list and attaches all failures per ISIN
+    in the attribute "failed_isins".
+    """
+    stock_list = [parsed[isin] for isin in isin_list if isin in parsed]
+    failed_isins = {isin: failures[isin] for isin in isin_list if isin in failures}
+    if len(failed_isins) > 0:
+        logger.error(f"EXTRACT: Extract stock {description} from justetf was not possible for "
+                     f"{len(failed_isins)} of {len(isin_list)} stocks: {list(failed_isins.keys())}")
+    df = pd.DataFrame(stock_list)
+    df.attrs["failed_isins"] = failed_isins
+    return df
+
 
-        html = r.content.decode("utf-8")
-        stock_dict = parse_etf_master_data(html)
-        stock_dict["ISIN"] = isin
-        stock_list.append(stock_dict)
-    assert len(stock_list) == len(
-        isin_list), "EXTRACT: Extract stock master data from justetf was not possible for all stocks!"
-    return pd.DataFrame(stock_list)
+def extract_etf_master_data(isin_list: list, source_url: str, max_workers=8, requests_per_second=2., parser="lxml",
+                            cache=None, ttl=0):
+    """
+    Extracts all masterdata for all stocks in isin_list from justetf.com. The overview pages are fetched
+    concurrently, failing ISINs are skipped and reported in the attribute "failed_isins" of the result.
+    :param isin_list: List of ISINs for which master data should be extracted.
+    :param source_url: base url of the justetf.com etf profile
+    :param max_workers: maximum number of concurrent requests
+    :param requests_per_second: maximum number of requests per second against justetf.com
+    :param parser: parser backend used to build the DOM tree
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of cached pages in seconds
+    :return: dataframe of master data, one row per ISIN in the order of isin_list
+    """
+    pages, failures = fetch_etf_overview_pages(isin_list, source_url, max_workers, requests_per_second,
+                                               cache=cache, ttl=ttl)
+    parsed, errors = _parse_pages(pages, {"master data": parse_etf_master_data}, parser=parser)
+    return _to_dataframe(parsed["master data"], isin_list, {**failures, **errors["master data"]}, "master data")
 
 
-def extract_etf_price_data(isin_list: list, source_url: str):
+def extract_etf_price_data(isin_list: list, source_url: str, max_workers=8, requests_per_second=2., parser="lxml",
+                           cache=None, ttl=0):
     """
-    Iterate through list of ISINs and call justetf.com overview page for each stock and extract price informations.
+    Call justetf.com overview page for each stock in the list of ISINs concurrently and extract price informations.
+    Failing ISINs are skipped and reported in the attribute "failed_isins" of the result.
     :param isin_list: list of ISINs for all stocks, for which price should be extracted
-    :param source_url:
-    :return: list of price dictionaries
-    """
-    stock_list = []
-    for isin in isin_list:
-        url = source_url + f"?query={isin}&groupField=index&from=search&isin={isin}#overview"
-        r = requests.get(url)
-        assert r.status_code == 200, "HTTP Error, {}".format(r.status_code)
-
-        html = r.content.decode("utf-8")
-        stock_dict = parse_etf_prices(html)
-        stock_dict["ISIN"] = isin
-        stock_list.append(stock_dict)
-    assert len(stock_list) == len(isin_list), "EXTRACT: Extract stock price data from justetf was not possible for all stocks!"
-    return pd.DataFrame(stock_list)
\ No newline at end of file
+    :param source_url: base url of the justetf.com etf profile
+    :param max_workers: maximum number of concurrent requests
+    :param requests_per_second: maximum number of requests per second against justetf.com
+    :param parser: parser backend used to build the DOM tree
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of cached pages in seconds
+    :return: dataframe of prices, one row per ISIN in the order of isin_list
+    """
+    pages, failures = fetch_etf_overview_pages(isin_list, source_url, max_workers, requests_per_second,
+                                               cache=cache, ttl=ttl)
+    parsed, errors = _parse_pages(pages, {"price data": parse_etf_prices}, parser=parser)
+    return _to_dataframe(parsed["price data"], isin_list, {**failures, **errors["price data"]}, "price data")
+
+
+def extract_etf_data(master_isin_list: list, price_isin_list: list, source_url: str,
+                     max_workers=8, requests_per_second=2., parser="lxml",
+                     cache=None, master_ttl=0, price_ttl=0):
+    """
+    Extracts master data and prices from justetf.com in a single pass: The overview page of every ISIN in the union
+    of both lists is fetched once, its DOM tree is built once and both parsers run on the same tree.
+    Failing ISINs are skipped and reported in the attribute "failed_isins" of each result.
+    :param master_isin_list: list of ISINs for which master data should be extracted
+    :param price_isin_list: list of ISINs for which prices should be extracted
+    :param source_url: base url of the justetf.com etf profile
+    :param max_workers: maximum number of concurrent requests
+    :param requests_per_second: maximum number of requests per second against justetf.com
+    :param parser: parser backend used to build the DOM tree
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param master_ttl: time to live of cached pages in seconds, which are only needed for master data
+    :param price_ttl: time to live of cached pages in seconds, which are needed for prices
+    :return: tuple of dataframes (master data, prices), rows in the order of the respective ISIN list
+    """
+    all_isins = list(dict.fromkeys(list(master_isin_list) + list(price_isin_list)))
+    ### Prices change daily, master data rarely: pages needed for prices use the shorter TTL
+    ttl = {isin: price_ttl if isin in price_isin_list else master_ttl for isin in all_isins}
+    pages, failures = fetch_etf_overview_pages(all_isins, source_url, max_workers, requests_per_second,
+                                               cache=cache, ttl=ttl)
+    parsed, errors = _parse_pages(pages,
+                                  {"master data": parse_etf_master_data, "price data": parse_etf_prices},
+                                  parser=parser,
+                                  )
+    return (_to_dataframe(parsed["master data"], master_isin_list, {**failures, **errors["master data"]},
+                          "master data"),
+            _to_dataframe(parsed["price data"], price_isin_list, {**failures, **errors["price data"]},
+                          "price data"))
@@ -1,16 +1,59 @@
-from bs4 import BeautifulSoup
+import time
+import logging
+from bs4 import BeautifulSoup, SoupStrainer
 from datetime import date
 
+logger = logging.getLogger(__name__)
 
 
-def parse_etf_master_data(html: str):
+def _keep_etf_node(name, attrs=None) -> bool:
+    """
+    Filter for SoupStrainer: Keeps only nodes of the justetf.com overview page, that are needed by the parsers
+    (h1 with the stock name, infoboxes and tables). All other nodes are not added to the tree.
+    bs4 >= 4.13 passes only the tag name to the filter, in this case all divs are kept.
+    """
+    if attrs is None:
+        return name in ("h1", "table", "div")
+    classes = attrs.get("class") or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    return name in ("h1", "table") or (name == "div" and "infobox" in classes)
+
+
+ETF_PAGE_STRAINER = SoupStrainer(_keep_etf_node)
+
+
+def build_etf_soup(html: str, parser="lxml", strain=True) -> BeautifulSoup:
+    """
+    Builds the DOM tree of a justetf.com overview page once, so that it can be shared by all parsers.
+    :param html: HTML of justetf.com overview page
+    :param parser: parser backend of BeautifulSoup, "lxml" is much faster than "html.parser"
+    :param strain: whether only nodes needed by the parsers are kept in the tree
+    :return: BeautifulSoup object of the page
+    """
+    start = time.perf_counter()
+    soup_base = BeautifulSoup(html, parser, parse_only=ETF_PAGE_STRAINER if strain else None)
+    logger.debug(f"EXTRACT: Parsed page with {parser} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return soup_base
+
+
+def _get_soup(html) -> BeautifulSoup:
+    """
+    Returns the input if it is already a BeautifulSoup object, otherwise builds the DOM tree from HTML.
+    """
+    if isinstance(html, BeautifulSoup):
+        return html
+    return build_etf_soup(html)
+
+
+def parse_etf_master_data(html):
     """
     Extracts masterdata for each stock given by the BeautifulSoup object from justetf.com overpage.
-    :param soup_base: HTML object from justetf.com overview page
+    :param html: HTML or BeautifulSoup object (see build_etf_soup) of justetf.com overview page
     :return: dictionary of masterdata key:value pairs
     """
-    soup_base = BeautifulSoup(html, 'html.parser')
-    assert isinstance(soup_base, type(BeautifulSoup())), "EXTRACT: Input is no BeautifulSoup object!"
+    soup_base = _get_soup(html)
+    assert isinstance(soup_base, BeautifulSoup), "EXTRACT: Input is no BeautifulSoup object!"
     metadata = {}
     ### Get name of stock
     stock_name = soup_base.find_all("h1")[0].find_all("span", {"class": "h1"})[0].text
@@ -41,22 +84,22 @@ def parse_etf_master_data(html: str):
         for body in bodies:
             rows = body.find_all("tr")
             for row in rows:
-                if len(row.find_all("td")) == 2:
-                    label = row.find_all("td")[0].text.replace(" ", "").replace("\n", "")
-                    value = row.find_all("td")[1].text.replace(" ", "").replace("\n", "")
+                cells = row.find_all("td")
+                if len(cells) == 2:
+                    label = cells[0].text.replace(" ", "").replace("\n", "")
                     if label in needed_labels:
-                        metadata[label] = value
+                        metadata[label] = cells[1].text.replace(" ", "").replace("\n", "")
     return metadata
 
 
-def parse_etf_prices(html: str):
+def parse_etf_prices(html):
     """
     Extracts price information from BeautifulSoup object created from HTML of justetf.com overview page.
-    :param html: HTML of justetf.com overview page
+    :param html: HTML or BeautifulSoup object (see build_etf_soup) of justetf.com overview page
     :return: dictionary with price, currency, Datum keys
     """
-    soup_base = BeautifulSoup(html, 'html.parser')
-    assert isinstance(soup_base, type(BeautifulSoup())), "Input is no BeautifulSoup object!"
+    soup_base = _get_soup(html)
+    assert isinstance(soup_base, BeautifulSoup), "Input is no BeautifulSoup object!"
     price_dict = {}
 
     price_obj = soup_base.find_all("div", {"class": "infobox"})[0].find_all("div", {"class": "val"})[0].find_all("span")
@@ -67,4 +110,4 @@ def parse_etf_prices(html: str):
     price_dict["Price"] = price
     price_dict["Date"] = date.today().strftime("%d.%m.%Y")
 
-    return price_dict
\ No newline at end of file
+    return price_dict
@@ -1,10 +1,61 @@
+import os
 import pandas as pd
 import logging
+from datetime import date
 from ..utilities.utils import load_data, save_data
+from ..utilities.partitioned_store import PartitionedStore
 
 logger = logging.getLogger(__name__)
 
-def transform_etf_master(df_master: pd.DataFrame, df_region: pd.DataFrame, out_path: str):
+
+def get_isins_to_refresh(isin_list: list, master_path: str, max_age_days: int) -> list:
+    """
+    Determines all ISINs, whose master data needs to be scraped: ISINs, that are not yet in the ingested master data
+    or whose master data is older than max_age_days.
+    :param isin_list: list of all ISINs for which master data should exist
+    :param master_path: path to the ingested master data
+    :param max_age_days: maximum age in days of the master data of an ISIN
+    :return: list of ISINs in the order of isin_list
+    """
+    if not os.path.exists(master_path):
+        return list(isin_list)
+    df_existing = load_data(master_path)
+    if "LastUpdated" not in df_existing.columns:
+        logger.info("INGEST: STOCKS: Master data has no column LastUpdated, all ISINs are refreshed!")
+        return list(isin_list)
+    last_updated = pd.to_datetime(df_existing["LastUpdated"], format="%d.%m.%Y")
+    min_date = pd.Timestamp(date.today()) - pd.Timedelta(days=max_age_days)
+    fresh_isins = set(df_existing.loc[last_updated >= min_date, "ISIN"])
+    isins_to_refresh = [isin for isin in isin_list if isin not in fresh_isins]
+    logger.info(f"INGEST: STOCKS: Master data of {len(isins_to_refresh)} of {len(isin_list)} ISINs is refreshed!")
+    return isins_to_refresh
+
+
+def transform_etf_master(df_master: pd.DataFrame, df_region: pd.DataFrame, out_path: str,
+                         incremental=False, isin_list=None):
+    """
+    Joins the region map to the scraped master data and saves it.
+    :param df_master: scraped master data (see extract_etf_master_data)
+    :param df_region: region and type per ISIN
+    :param out_path: path to the ingested master data
+    :param incremental: whether the existing master data in out_path is updated with df_master instead of overwritten
+    :param isin_list: list of all ISINs, that should be kept in the master data (incremental mode only, default: all)
+    """
+    df_master = df_master.copy()
+    df_master["LastUpdated"] = date.today().strftime("%d.%m.%Y")
+    if incremental and os.path.exists(out_path):
+        df_existing = load_data(out_path)
+        ### Region columns are joined again below, so that changes in the region map also apply to existing rows
+        region_columns = [column for column in df_region.columns if column not in ["ISIN", "Name"]]
+        df_existing = df_existing.drop(columns=region_columns, errors="ignore")
+        if len(df_master) > 0:
+            df_existing = df_existing[~df_existing["ISIN"].isin(df_master["ISIN"])]
+        df_master = pd.concat([df_existing, df_master], ignore_index=True, sort=False)
+        if isin_list is not None:
+            ### Keep only ISINs of isin_list in the same order as in isin_list
+            isin_order = {isin: position for position, isin in enumerate(isin_list)}
+            df_master = df_master[df_master["ISIN"].isin(isin_order.keys())]\
+                                .sort_values("ISIN", key=lambda isins: isins.map(isin_order))
     df_master = df_master.merge(df_region,
                                 how="left",
                                 left_on="ISIN",
@@ -16,20 +67,23 @@ def transform_etf_master(df_master: pd.DataFrame, df_region: pd.DataFrame, out_p
     save_data(df_master, out_path)
 
 
-def transform_historization_etf_prices(df_prices_batch: pd.DataFrame, out_path: str):
-    df_prices_full = load_data(out_path)
+def transform_historization_etf_prices(df_prices_batch: pd.DataFrame, out_path: str, legacy_csv_path=None):
+    """
+    Appends a batch of extracted prices to the partitioned price history. Dates, that already exist in the history,
+    are not updated.
+    :param df_prices_batch: extracted prices (see extract_etf_price_data) with columns ISIN, Price, Currency, Date
+    :param out_path: root directory of the price history store
+    :param legacy_csv_path: csv file of the full price history, which is imported, if the store is still empty
+    """
+    price_store = PartitionedStore(out_path)
+    if legacy_csv_path is not None and os.path.exists(legacy_csv_path) and len(price_store.dates()) == 0:
+        logger.info(f"INGEST: STOCKS: Import price history from {legacy_csv_path}")
+        price_store.append(load_data(legacy_csv_path))
 
+    if len(df_prices_batch) == 0:
+        logger.warning("INGEST: STOCKS: No price data extracted! No update done!")
+        return
     logger.debug("QUALITY: Check if extracted price-data already exists!")
-    overlap = df_prices_full.merge(df_prices_batch,
-                                   left_on="Date",
-                                   right_on="Date",
-                                   how="inner"
-                                   )
-    if overlap.count()[0] == 0:
-        df_prices_updated = df_prices_full.append(df_prices_batch,
-                                             ignore_index=True,
-                                             )
-        assert df_prices_updated.count()[0] == df_prices_full.count()[0] + df_prices_batch.count()[0], "Appending prices failed!"
-        save_data(df_prices_updated, out_path)
-    else:
-        logger.warning("INGEST: STOCKS: Price data for this date already exists! No update done!")
\ No newline at end of file
+    written_dates = price_store.append(df_prices_batch)
+    if len(written_dates) == 0:
+        logger.warning("INGEST: STOCKS: Price data for this date already exists! No update done!")
@@ -1,13 +1,42 @@
+import os
+import time
+import logging
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from ..utilities.sheet_cache import load_workbook_cached
+from ..toshl_datahub.toshl_datahub import load_consolidated_cashflow
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_load(load_function, file_path: str, *args):
+    """
+    Calls load_function(file_path, *args) and logs the time needed to load file_path.
+    """
+    start = time.perf_counter()
+    result = load_function(file_path, *args)
+    logger.info(f"LOAD: {file_path} loaded in {time.perf_counter() - start:.2f} s")
+    return result
+
+def _load_cashflow(cashflow_path: str) -> pd.DataFrame:
+    """
+    Loads the appended Toshl exports either from the consolidated store (directory) or from a csv file.
+    """
+    if os.path.isdir(cashflow_path):
+        return load_consolidated_cashflow(cashflow_path)
+    return pd.read_csv(cashflow_path)
 
 def load_data(portfolio_data_absolute_path="/home/chris/Dropbox/Finance/data/portfolio_trades.ods",
               stock_data_absolute_path="/home/chris/Dropbox/Finance/data/stock_trades.ods",
               income_data_absolute_path="/home/chris/Dropbox/Finance/data/income.ods",
               etf_master_data_absolute_path="/home/chris/Dropbox/Finance/data/generated/master_data_stocks.ods",
               stock_price_data_absolute_path="/home/chris/Dropbox/Finance/data/generated/stock_prices.ods",
-              cashflow_path = "/home/chris/Dropbox/Finance/data/data_cashflow/bilanz_full.csv",
+              cashflow_path = "/home/chris/Dropbox/Finance/data/data_cashflow/consolidated",
               crypto_path = "/home/chris/Dropbox/Finance/data/crypto/exported/crypto_orders_longlist.csv",
-              include_speculation=False):
+              include_speculation=False,
+              sheet_cache_dir=None,
+              max_workers=8,
+              use_processes=False):
     """
     Needs odfpy library to load .ods files!
     Loads all necessary data sources of the given portfolio: ETF savings portfolio data, speculation data
@@ -16,26 +45,45 @@ def load_data(portfolio_data_absolute_path="/home/chris/Dropbox/Finance/data/por
     :param etf_master_data_absolute_path: path to master data of ETFs (filetype: .ods)
     :param stock_price_data_absolute_path: path to price data of ETFs (filetype: .ods)
     :param include_speculation: Whether orders of speculation portfolio should be included in output
-    :param cashflow_path: csv file of cashflow data
+    :param cashflow_path: directory of the consolidated cashflow store (see toshl_datahub.update_cashflow_data)
+                          or csv file of cashflow data
+    :param sheet_cache_dir: directory of the columnar cache of .ods sheets (see load_workbook_cached),
+                            default: next to each workbook
+    :param max_workers: maximum number of files loaded concurrently
+    :param use_processes: whether files are loaded in a process pool instead of a thread pool (parsing .ods files
+                          without cache is CPU-bound and does not run in parallel in threads)
     :return: tupel of pd.DataFrames with portfolio transactions and master data
     """
-    orders_portfolio = pd.read_excel(portfolio_data_absolute_path, engine="odf", sheet_name="Buys")
-    dividends_portfolio = pd.read_excel(portfolio_data_absolute_path, engine="odf", sheet_name="Dividends")
-    orders_speculation = pd.read_excel(stock_data_absolute_path, engine="odf", sheet_name="Buys")
-
-    income = pd.read_excel(income_data_absolute_path, engine="odf")
-
-    stock_prices = pd.read_csv(stock_price_data_absolute_path)
-
-    etf_master = pd.read_csv(etf_master_data_absolute_path)
-
-    cashflow_init = pd.read_csv(cashflow_path)
-
-    df_crypto_trades = pd.read_csv(crypto_path)
+    ### All sources are independent: load them concurrently and log the load time of each file
+    loaders = {
+        "portfolio": (load_workbook_cached, portfolio_data_absolute_path, ["Buys", "Dividends"], sheet_cache_dir),
+        "income": (load_workbook_cached, income_data_absolute_path, [0], sheet_cache_dir),
+        "stock_prices": (pd.read_csv, stock_price_data_absolute_path),
+        "etf_master": (pd.read_csv, etf_master_data_absolute_path),
+        "cashflow": (_load_cashflow, cashflow_path),
+        "crypto": (pd.read_csv, crypto_path),
+    }
+    if include_speculation == True:
+        loaders["speculation"] = (load_workbook_cached, stock_data_absolute_path, ["Buys"], sheet_cache_dir)
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    start = time.perf_counter()
+    with executor_class(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(_timed_load, *loader) for name, loader in loaders.items()}
+        sources = {name: future.result() for name, future in futures.items()}
+    logger.info(f"LOAD: All sources loaded in {time.perf_counter() - start:.2f} s")
+
+    orders_portfolio = sources["portfolio"]["Buys"]
+    dividends_portfolio = sources["portfolio"]["Dividends"]
+    income = sources["income"][0]
+    stock_prices = sources["stock_prices"]
+    etf_master = sources["etf_master"]
+    cashflow_init = sources["cashflow"]
+    df_crypto_trades = sources["crypto"]
 
     if include_speculation == True:
         return ((etf_master, orders_portfolio, dividends_portfolio, income, stock_prices, cashflow_init,
-                 orders_speculation, df_crypto_trades))
+                 sources["speculation"]["Buys"], df_crypto_trades))
     else:
         return ((etf_master, orders_portfolio, dividends_portfolio, income, stock_prices, cashflow_init,
                  None, df_crypto_trades))
@@ -52,35 +100,29 @@ def cleaning_cashflow(df_input: pd.DataFrame) -> pd.DataFrame:
     df_init = df_input.copy()
     df_init['Date'] = pd.to_datetime(df_init['Date'], format='%m/%d/%y')
     df_init.drop(columns=['Account', 'Currency', 'Main currency', 'Description'], inplace=True)
-    df_init['Expense amount'] = df_init['Expense amount'].str.replace(',', '')
-    df_init['Income amount'] = df_init['Income amount'].str.replace(',', '').astype(np.float64)
-    df_init['In main currency'] = df_init['In main currency'].str.replace(',', '')
-    df_init['Expense amount'] = df_init['Expense amount'].astype(np.float64)
-    df_init['In main currency'] = df_init['In main currency'].astype(np.float64)
+    for amount_column in ['Expense amount', 'Income amount', 'In main currency']:
+        df_init[amount_column] = df_init[amount_column].str.replace(',', '', regex=False).astype(np.float64)
 
     ### Preprocessing of cashflow amounts
-    df_init['Amount'] = pd.Series([-y if x > 0. else y
-                                   for x, y in zip(df_init['Expense amount'],
-                                                   df_init['In main currency']
-                                                    )
-                                   ]
-                                   )
-    assert df_init[(~df_init["Income amount"].isin(["0.0", "0"])) &
-                   (df_init["In main currency"] != df_init["Amount"])
-                   ].count().sum() == 0, "Income amount does not match with main currency amount!"
-    assert df_init[(~df_init["Expense amount"].isin(["0.0", "0"])) &
-                   (-df_init["In main currency"] != df_init["Amount"])
-                   ].count().sum() == 0, "Expense amount does not match with main currency amount!"
+    df_init['Amount'] = np.where(df_init['Expense amount'].to_numpy() > 0.,
+                                 -df_init['In main currency'].to_numpy(),
+                                 df_init['In main currency'].to_numpy()
+                                 )
+    assert not ((df_init["Income amount"] != 0.) &
+                (df_init["In main currency"] != df_init["Amount"])
+                ).any(), "Income amount does not match with main currency amount!"
+    assert not ((df_init["Expense amount"] != 0.) &
+                (-df_init["In main currency"] != df_init["Amount"])
+                ).any(), "Expense amount does not match with main currency amount!"
 
     ### Remap all tags with category "Urlaub" to "old-tag, Urlaub" and map afterwards all double-tags
     ### containing "Urlaub" to the Urlaub tag
-    df_init.loc[df_init["Category"] == "Urlaub", "Tags"] = df_init["Tags"].apply(lambda tag: tag + ", Urlaub")
-    df_init["split_tags"] = df_init["Tags"].apply(lambda x: x.split(","))
-    assert df_init[df_init["split_tags"].apply(len) > 1]["split_tags"].apply(lambda x: \
-                                                                             "Urlaub" in [s.strip() for s in x]
-                                                                             ).all() == True,\
+    is_urlaub = df_init["Category"] == "Urlaub"
+    df_init.loc[is_urlaub, "Tags"] = df_init.loc[is_urlaub, "Tags"] + ", Urlaub"
+    has_multiple_tags = df_init["Tags"].str.contains(",", regex=False)
+    assert df_init.loc[has_multiple_tags, "Tags"].str.contains(r"(?:^|,)\s*Urlaub\s*(?:,|$)").all() == True, \
             'Some entries with multiple tags do not contain "Urlaub"! Mapping not possible!'
-    df_init.loc[df_init["split_tags"].apply(len) > 1, "Tags"] = "Urlaub"
+    df_init.loc[has_multiple_tags, "Tags"] = "Urlaub"
 
     df_init = df_init[["Date", "Category", "Tags", "Amount"]]
     return(df_init)
@@ -95,13 +137,46 @@ def split_cashflow_data(df_cleaned: pd.DataFrame) -> pd.DataFrame:
     assert set(needed_columns).intersection(set(df_cleaned.columns)) == set(needed_columns), \
         "Columns missing! Need: {0}, Have: {1}".format(needed_columns, list(df_cleaned.columns))
 
-    df_grouped = df_cleaned.groupby([pd.Grouper(key='Date', freq='1M'), 'Tags']).sum()
+    df_grouped = df_cleaned.groupby([pd.Grouper(key='Date', freq='1M'), 'Tags'], observed=True).sum()
 
     incomes = df_grouped[df_grouped["Amount"] > 0.].copy()
     expenses = df_grouped[df_grouped["Amount"] <= 0.].copy()
 
     return((incomes, expenses))
 
+### Custom categories for all tags of Toshl
+CASHFLOW_CATEGORIES = {
+    "home": ['rent', 'insurance', 'Miete'],
+    "food_healthy": ['restaurants', 'Lebensmittel', 'groceries', 'Restaurants', 'Restaurant Mittag'],
+    "food_unhealthy": ['Fast Food', 'Süßigkeiten'],
+    "alcoholic_drinks": ['alcohol', 'Alkohol'],
+    "non-alcoholic_drinks": ['Kaffee und Tee', 'Erfrischungsgetränke', 'coffee & tea', 'soft drinks'],
+    "travel_vacation": ['sightseeing', 'Sightseeing', 'Beherbergung', 'accommodation', 'Urlaub'],
+    "transportation": ['bus', 'Bus', 'taxi', 'Taxi', 'metro', 'Metro', 'Eisenbahn', 'train', 'car',
+                      'Auto', 'parking', 'airplane', 'fuel', 'Flugzeug'],
+    "sports": ['training', 'Training', 'MoTu', 'Turnier', 'sport equipment', 'Billard', 'Konsum Training'],
+    "events_leisure_books_abos": ['events', 'Events', 'adult fun', 'Spaß für Erwachsene', 'games', 'sport venues',
+                             'membership fees', 'apps', 'music', 'books'],
+    "clothes_medicine": ['clothes', 'accessories', 'cosmetics', 'medicine', 'hairdresser',
+                              'medical services', 'medical servies', "shoes"],
+    "private_devices": ['devices', 'bike', 'bicycle', 'movies & TV', 'mobile phone', 'home improvement',
+               'internet', 'landline phone', 'furniture'],
+    "presents": ['birthday', 'X-Mas'],
+    "other": ['wechsel', 'income tax', 'tuition', 'publications', 'Spende'],
+    "stocks": ['equity purchase'],
+    #### Income categories
+    "compensation_caution": ["Entschädigung"],
+    "salary": ["Salary", "Gehalt Vorschuss", "Reisekosten"],
+    "present": ["Geschenk"],
+    "tax_compensation": ["Kirchensteuer Erstattung", "Steuerausgleich"],
+    "investment_profit": ["Investing"]
+}
+### Lookup table tag:category, built once (if a tag is listed in several categories, the first category is used)
+TAG_CATEGORY_MAP = {}
+for _category, _tag_list in CASHFLOW_CATEGORIES.items():
+    for _tag in _tag_list:
+        TAG_CATEGORY_MAP.setdefault(_tag, _category)
+
 def preprocess_cashflow(df: pd.DataFrame) -> pd.DataFrame:
     """
     Remap tags of input data to custom categories, and change the format of the dataframe in order to
@@ -113,71 +188,96 @@ def preprocess_cashflow(df: pd.DataFrame) -> pd.DataFrame:
     assert isinstance(df.index, pd.core.indexes.multi.MultiIndex) and \
             set(df.index.names) == set(["Date", "Tags"]) and \
             list(df.columns) == ["Amount"], "Dataframe is not grouped by month!"
-    ### Define custom categories for all tags of Toshl: Make sure category names differ from tag-names,
-    ### otherwise column is dropped and aggregate is wrong
-    category_dict = {
-        "home": ['rent', 'insurance', 'Miete'],
-        "food_healthy": ['restaurants', 'Lebensmittel', 'groceries', 'Restaurants', 'Restaurant Mittag'],
-        "food_unhealthy": ['Fast Food', 'Süßigkeiten'],
-        "alcoholic_drinks": ['alcohol', 'Alkohol'],
-        "non-alcoholic_drinks": ['Kaffee und Tee', 'Erfrischungsgetränke', 'coffee & tea', 'soft drinks'],
-        "travel_vacation": ['sightseeing', 'Sightseeing', 'Beherbergung', 'accommodation', 'Urlaub'],
-        "transportation": ['bus', 'Bus', 'taxi', 'Taxi', 'metro', 'Metro', 'Eisenbahn', 'train', 'car',
-                          'Auto', 'parking', 'airplane', 'fuel', 'Flugzeug'],
-        "sports": ['training', 'Training', 'MoTu', 'Turnier', 'sport equipment', 'Billard', 'Konsum Training'],
-        "events_leisure_books_abos": ['events', 'Events', 'adult fun', 'Spaß für Erwachsene', 'games', 'sport venues',
-                                 'membership fees', 'apps', 'music', 'books'],
-        "clothes_medicine": ['clothes', 'accessories', 'cosmetics', 'medicine', 'hairdresser',
-                                  'medical services', 'medical servies', "shoes"],
-        "private_devices": ['devices', 'bike', 'bicycle', 'movies & TV', 'mobile phone', 'home improvement',
-                   'internet', 'landline phone', 'furniture'],
-        "presents": ['birthday', 'X-Mas'],
-        "other": ['wechsel', 'income tax', 'tuition', 'publications', 'Spende'],
-        "stocks": ['equity purchase'],
-        #### Income categories
-        "compensation_caution": ["Entschädigung"],
-        "salary": ["Salary", "Gehalt Vorschuss", "Reisekosten"],
-        "present": ["Geschenk"],
-        "tax_compensation": ["Kirchensteuer Erstattung", "Steuerausgleich"],
-        "investment_profit": ["Investing"]
-    }
-    from functools import reduce
-    category_list = reduce(lambda x, y: x + y, category_dict.values())
-
-
-    ### Need another format of the table, fill NaNs with zero and drop level 0 index "Amount"
-    pivot_init = df.unstack()
-    pivot_init.fillna(0, inplace=True)
-    pivot_init.columns = pivot_init.columns.droplevel()
+    df_long = df.reset_index()
+    index = df.index.remove_unused_levels()
+    all_dates = index.levels[index.names.index("Date")]
+    tags = df_long["Tags"]
 
     #### Extract expenses and incomes from building-upkeep (caution) when switching flats
-    if 'building upkeep' in pivot_init.columns:
-        building_upkeep = pivot_init['building upkeep']
-        pivot_init.drop(columns=['building upkeep'], inplace=True)
-    elif 'Wechsel' in pivot_init.columns:
-        building_upkeep = pivot_init['Wechsel']
-        pivot_init.drop(columns=['Wechsel'], inplace=True)
-    else:
-        building_upkeep = None
-
-    ### Apply custom category definition to dataframe
-    not_categorized = [tag for tag in pivot_init.columns if tag not in category_list]
+    building_upkeep = None
+    for upkeep_tag in ['building upkeep', 'Wechsel']:
+        is_upkeep = tags == upkeep_tag
+        if is_upkeep.any():
+            building_upkeep = df_long[is_upkeep].groupby("Date")["Amount"].sum()\
+                                                .reindex(all_dates, fill_value=0.)\
+                                                .rename(upkeep_tag)
+            df_long = df_long[~is_upkeep]
+            break
+
+    ### Apply custom category definition to dataframe with a single lookup and a single aggregation
+    categories = df_long["Tags"].map(TAG_CATEGORY_MAP)
+    not_categorized = sorted(df_long.loc[categories.isna(), "Tags"].unique())
     assert len(not_categorized) == 0, "There are some tags, which are not yet categorized: {}".format(not_categorized)
 
-    pivot = pivot_init.copy()
-    for category, tag_list in category_dict.items():
-        tag_list_in_data = list(set(tag_list).intersection(set(pivot.columns)))
-        pivot[category] = pivot[tag_list_in_data].sum(axis=1)
-        pivot.drop(columns=tag_list_in_data, inplace=True)
+    pivot = df_long.groupby(["Date", categories.rename("Tags")], observed=True)["Amount"].sum()\
+                   .unstack(fill_value=0.)\
+                   .reindex(index=all_dates, columns=list(CASHFLOW_CATEGORIES.keys()), fill_value=0.)
+    pivot.columns.name = "Tags"
 
     ### Keep only categories with non-zero total amount in dataframe
-    category_sum = pivot.sum().reset_index()
-    nonzero_categories = list(category_sum[category_sum[0] != 0.]["Tags"])
-
-    pivot = pivot[nonzero_categories]
+    pivot = pivot.loc[:, pivot.sum() != 0.]
 
     return((building_upkeep, pivot))
 
+class MonthlyCube:
+    """
+    Precomputed month x category aggregates of a cashflow pivot (see preprocess_cashflow) for the expenses and income
+    tabs: The pivot gets an additional column Overall (sum over all categories) and prefix sums along the sorted
+    months. A timespan only determines the first month of a query (binary search), so the values of a category and
+    their average are a slice and a difference of two prefix sums.
+    """
+    def __init__(self, df_pivot: pd.DataFrame, overall_column="Overall"):
+        """
+        :param df_pivot: dataframe with monthly dates as index and one column per category
+        :param overall_column: name of the column holding the sum over all categories
+        """
+        import numpy as np
+        assert overall_column not in df_pivot.columns, f"Category {overall_column} is reserved for the overall sum!"
+        self.overall_column = overall_column
+        self.df = df_pivot.sort_index().copy()
+        self.df[overall_column] = self.df.sum(axis=1)
+        self.categories = list(df_pivot.columns)
+        self._dates = self.df.index.values
+        self._column_positions = {column: position for position, column in enumerate(self.df.columns)}
+        values = self.df.to_numpy(dtype=np.float64)
+        self._prefix_sums = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+
+    def _start(self, timespan: int) -> int:
+        """
+        Position of the first month inside the timespan, same cut as in filter_portfolio_date.
+        """
+        import numpy as np
+        from datetime import date
+        if timespan == -1:
+            return 0
+        date_start = pd.Timestamp(date.today()) - pd.DateOffset(months=timespan)
+        return int(np.searchsorted(self._dates, np.datetime64(date_start), side="left"))
+
+    def _position(self, category: str) -> int:
+        assert category in self._column_positions, "Category not in columns of dataframe!"
+        return self._column_positions[category]
+
+    def series(self, timespan: int, category: str) -> pd.Series:
+        """
+        :param timespan: How many months into the past the data should range (-1 for all months)
+        :param category: Category or overall_column
+        :return: monthly values of the category inside the timespan, indexed by Date
+        """
+        return self.df.iloc[self._start(timespan):, self._position(category)]
+
+    def average(self, timespan: int, category: str) -> float:
+        """
+        :param timespan: How many months into the past the data should range (-1 for all months)
+        :param category: Category or overall_column
+        :return: average monthly value of the category inside the timespan, NaN if there is no month in the timespan
+        """
+        start = self._start(timespan)
+        n_months = len(self._dates) - start
+        if n_months == 0:
+            return float("nan")
+        position = self._position(category)
+        return float((self._prefix_sums[-1, position] - self._prefix_sums[start, position]) / n_months)
+
 def combine_incomes(toshl_income, excel_income):
     """
     Combines two data sources of incomes: toshl incomes and incomes from cashflow excel.
@@ -198,25 +298,43 @@ def combine_incomes(toshl_income, excel_income):
     df_income = pd.concat([df_in, df_in2], ignore_index=True)
     assert df_income.count()[0] == df_in.count()[0] + df_in2.count()[0], "Some income rows were lost!"
 
-    df_income = df_income.groupby([pd.Grouper(key='Date', freq='1M'), 'Tags']).sum()
+    df_income = df_income.groupby([pd.Grouper(key='Date', freq='1M'), 'Tags'], observed=True).sum()
 
     return(df_income)
 
-def preprocess_prices(df_prices: pd.DataFrame) -> pd.DataFrame:
+def preprocess_prices(df_prices: pd.DataFrame, currency="EUR", fx_rates=None) -> pd.DataFrame:
     """
-    Preprocessing of price dataframe. Get latest available price.
+    Preprocessing of price dataframe. Get latest available price. Prices in other currencies are converted into
+    currency with the conversion rate of their date.
     :param df_prices: Needed columns: ISIN, Price, Datum, Currency
+    :param currency: currency of the resulting prices
+    :param fx_rates: FxRates used for the conversion, default: process-wide FxRates without rate store
     :return: dataframe containing prices of stocks defined by ISIN on latest available date
     """
     dfp = df_prices.copy()
-    assert dfp["Currency"].drop_duplicates().count() == 1, "Multiple currencies used for price data!"
-    assert dfp["Currency"].iloc[0] == "EUR", "Currency is not Euro!"
-
     dfp["Date"] = pd.to_datetime(dfp["Date"], format="%d.%m.%Y")
     latest_date = dfp["Date"].max()
     df_current_prices = dfp[dfp["Date"] == latest_date].reset_index(drop=True)
-    return(df_current_prices)
+    return(_convert_prices(df_current_prices, currency, fx_rates))
+
+
+def _convert_prices(df_prices: pd.DataFrame, currency: str, fx_rates=None) -> pd.DataFrame:
+    """
+    Converts the column Price of all rows, whose Currency is not currency, with the rate of their Date (datetime).
+    """
+    from ..utilities.fx_rates import default_fx_rates
 
+    foreign = (df_prices["Currency"] != currency).to_numpy()
+    if not foreign.any():
+        return(df_prices)
+    fx_rates = default_fx_rates() if fx_rates is None else fx_rates
+    logger.info(f"PROCESSING: Convert {foreign.sum()} prices in "
+                f"{sorted(df_prices.loc[foreign, 'Currency'].astype(str).unique())} to {currency}")
+    df_prices = df_prices.copy()
+    df_prices.loc[foreign, "Price"] = fx_rates.convert(df_prices[foreign], ["Price"], currency,
+                                                       currency_column="Currency", date_column="Date")["Price"]
+    df_prices["Currency"] = currency
+    return(df_prices)
 
 def preprocess_orders(df_orders: pd.DataFrame) -> pd.DataFrame:
     """
@@ -285,6 +403,10 @@ def compute_crypto_portfolio_value(portfolio: pd.DataFrame, prices: pd.DataFrame
     :param prices: Holds prices and masterdata of cryptos (name, symbol, price)
     :return: Value of portfolio per cryptocurrency
     """
+    ### Held cryptocurrencies without price are not part of the output
+    missing_symbols = sorted(portfolio.loc[~portfolio["currency"].isin(prices["symbol"]), "currency"].unique())
+    if len(missing_symbols) > 0:
+        logger.warning(f"PROCESSING: No price for cryptocurrencies {missing_symbols}! They are not valued!")
 
     portfolio_all = portfolio.merge(prices, left_on="currency", right_on="symbol").copy()
     portfolio_all = portfolio_all[["exchange", "currency", "name", "amount", "price"]]
@@ -292,9 +414,9 @@ def compute_crypto_portfolio_value(portfolio: pd.DataFrame, prices: pd.DataFrame
     portfolio_all.loc[:, "value"] = round(portfolio_all["amount"] * portfolio_all["price"], 2)
     portfolio_all = portfolio_all.drop("price", axis=1)
 
-    portfolio_all = portfolio_all.groupby(["exchange", "currency", "name"]).sum().reset_index()
+    portfolio_all = portfolio_all.groupby(["exchange", "currency", "name"], observed=True).sum().reset_index()
 
-    portfolio_overall = portfolio_all.groupby(["currency", "name"]).sum().reset_index()
+    portfolio_overall = portfolio_all.groupby(["currency", "name"], observed=True).sum().reset_index()
     portfolio_overall["exchange"] = "Overall"
 
     portfolio_value = portfolio_all.append(portfolio_overall, ignore_index=True, sort=False)
@@ -357,7 +479,7 @@ def compute_percentage_per_group(df: pd.DataFrame, group_names: list, compute_co
         compute_col = compute_columns[idx]
         agg_func = agg_functions[idx]
         if agg_func == "sum":
-            df_grouped = df_copy[[group, compute_col]].groupby([group]).sum()
+            df_grouped = df_copy[[group, compute_col]].groupby([group], observed=True).sum()
         total_sum = df_copy[compute_col].sum()
         df_grouped["Percentage"] = round(df_grouped[compute_col] / total_sum, 3) * 100
         result_list.append(df_grouped.reset_index())
@@ -440,63 +562,333 @@ def prepare_orderAmounts_prices(orders: pd.DataFrame):
     return((df_orders, prices))
 
 
+def _month_dates(dates: pd.Series) -> pd.Series:
+    """
+    Maps each date to the beginning of its month.
+    """
+    return(dates - pd.to_timedelta(dates.dt.day - 1, unit="D"))
+
+def _cumulate_timeseries(orders: pd.DataFrame, initial_state=None):
+    """
+    Computes the timeseries of all stocks in orders on top of an initial cumulative state.
+    All transactions are pivoted to date x stock matrices, cumulative amounts and investments are computed with a
+    single cumsum along the date axis. Multiple transactions of a stock in the same month are summed up.
+    :param orders: dataframe with columns Date, Name, Investment, Price, Ordercost
+    :param initial_state: dataframe indexed by Name with cumulative Investment, Ordercost, Amount of each stock before
+                          the first date in orders, None if orders start at the beginning of the history
+    :return: tuple (timeseries per stock, timeseries of overall portfolio, cumulative state after the last date)
+    """
+    import numpy as np
+    state_columns = ["Investment", "Ordercost", "Amount"]
+    if initial_state is None:
+        initial_state = pd.DataFrame(columns=state_columns, dtype=np.float64)
+    ### Map each transaction-date to the beginning of the month for easier comparison
+    month_dates = _month_dates(orders["Date"])
+
+    ### Codes of dates and stocks in order of appearance, they define the rows and columns of all matrices.
+    ### Stocks of the initial state come first, also if they are not part of orders.
+    date_codes, all_dates = pd.factorize(month_dates)
+    new_stocks = orders.loc[~orders["Name"].isin(initial_state.index), "Name"].drop_duplicates()
+    all_stocks = pd.Index(list(initial_state.index) + list(new_stocks))
+    stock_codes = all_stocks.get_indexer(orders["Name"])
+    shape = (len(all_dates), len(all_stocks))
+    initial_values = initial_state.reindex(all_stocks).fillna(0.)
+
+    def to_matrix(values: np.ndarray) -> np.ndarray:
+        matrix = np.zeros(shape)
+        np.add.at(matrix, (date_codes, stock_codes), values)
+        return matrix
+
+    investment = orders["Investment"].to_numpy(dtype=np.float64)
+    price = orders["Price"].to_numpy(dtype=np.float64)
+    ### Stocks, that were not bought at a date, have no price at that date (NaN) and therefore no value
+    price_matrix = np.full(shape, np.nan)
+    price_matrix[date_codes, stock_codes] = price
+
+    ### Compute cumsum() per stock along the sorted dates and restore the order of appearance of the dates
+    date_order = np.argsort(all_dates.values, kind="stable")
+    cumulated = {}
+    final_state = {}
+    for column, values in [("Investment", investment),
+                           ("Ordercost", orders["Ordercost"].to_numpy(dtype=np.float64)),
+                           ("Amount", investment / price)]:
+        cumsum_sorted = np.cumsum(to_matrix(values)[date_order], axis=0) + initial_values[column].to_numpy()
+        cumulated[column] = np.empty(shape)
+        cumulated[column][date_order] = cumsum_sorted
+        final_state[column] = cumsum_sorted[-1] if len(all_dates) > 0 else initial_values[column].to_numpy()
+    value_matrix = cumulated["Amount"] * price_matrix
+
+    df_stocks = pd.DataFrame({"Date": np.repeat(all_dates.values, len(all_stocks)),
+                              "Name": np.tile(np.asarray(all_stocks, dtype=object), len(all_dates)),
+                              "Investment": cumulated["Investment"].ravel(),
+                              "Ordercost": cumulated["Ordercost"].ravel(),
+                              "Value": value_matrix.ravel(),
+                              })
+
+    ### Finally sum over stock values at each date to arrive at timeseries format
+    df_overall = pd.DataFrame({"Date": all_dates.values[date_order],
+                               "Investment": cumulated["Investment"][date_order].sum(axis=1),
+                               "Ordercost": cumulated["Ordercost"][date_order].sum(axis=1),
+                               "Value": np.nansum(value_matrix[date_order], axis=1),
+                               })
+    df_overall["Name"] = "Overall Portfolio"
+    df_state = pd.DataFrame(final_state, index=all_stocks)[state_columns]
+    df_state.index.name = "Name"
+    return(df_stocks, df_overall, df_state)
+
 def prepare_timeseries(orders: pd.DataFrame):
     """
     Computes timeseries chart (value/investment vs date) for all stocks in the portfolio.
     Computes timeseries chart for overall portfolio (sum of all stock values at given date) and adds it
     to the dataframe.
     :param orders: dataframe, containing Investmentamount, ordercost and price for each stock per transactiondate
-    :return:
+    :return: dataframe with columns Date, Name, Investment, Ordercost, Value (one row per date and stock,
+             followed by the rows of the overall portfolio with name "Overall Portfolio")
     """
     necessary_columns = ["Date", "Name", "Investment", "Price", "Ordercost"]
     assert set(orders.columns).intersection(set(necessary_columns)) == set(necessary_columns), \
         "Necessary columns missing in order data for timeseries preparation!"
-    orders["Amount"] = orders["Investment"]/orders["Price"]
-    ### Map each transaction-date to the beginning of the month for easier comparison
-    orders["Date"] = orders["Date"].apply(lambda date: pd.offsets.MonthBegin().rollback(date))
-
-    ### Prepare master data of all stocks and dates in order history
-    ### TODO: Refine all data preprocessing to just once define master data for all needed tasks
-    all_stocks = pd.DataFrame(orders["Name"].drop_duplicates()).copy()
-    all_stocks["key"] = 0
-    all_dates = pd.DataFrame(orders["Date"].drop_duplicates()).copy()
-    all_dates["key"] = 0
-    all_combinations = pd.merge(all_dates, all_stocks, on='key').drop("key", axis=1)
-
-    ### Prepare dataframe, that gets converted to a timeseries, it has entries of all stocks, that were
-    ### bought in the past at each transaction-date (stock data for stocks, which were not bought at that date,
-    ### is filled with 0 to enable correct computation of cumsum()
-    group_columns = ["Investment", "Ordercost", "Amount"]
-    df_init = all_combinations.merge(orders[["Date", "Name"] + group_columns], how="left",
-                                     left_on=["Date", "Name"],
-                                     right_on=["Date", "Name"]
-                                     ).fillna(0).copy()
-    price_lookup = orders[["Date", "Name", "Price"]].copy()
-
-    ### Compute cumsum() per stockgroup and rejoin date
-    df_grouped = df_init.sort_values("Date").groupby("Name").cumsum()
-    df_grouped_all = df_init.merge(df_grouped, how="left",
-                                   left_index=True,
-                                   right_index=True,
-                                   suffixes=["_init", None]
-                                   )
-    df_grouped_all = df_grouped_all.drop(["Investment_init", "Ordercost_init", "Amount_init"], axis=1)
-    ### Rejoin prices and compute values for each stock at each date, fill values of stocks, which were not
-    ### bought at that date again with 0s
-    df_grouped_all = df_grouped_all.merge(price_lookup, how="left",
-                                          left_on=["Date", "Name"],
-                                          right_on=["Date", "Name"],
-                                          suffixes=[None, "_y"]
-                                          )
-    df_grouped_all["Value"] = df_grouped_all["Amount"] * df_grouped_all["Price"]
-    df_grouped_all = df_grouped_all.drop(["Amount", "Price"], axis=1)#.fillna(0)
+    (df_stocks, df_overall, _) = _cumulate_timeseries(orders)
+    df_timeseries = pd.concat([df_stocks, df_overall], ignore_index=True, sort=False)
+    return(df_timeseries)
 
-    ### Finally sum over stock values at each date to arrive at timeseries format
-    df_overall = df_grouped_all.sort_values("Date").set_index("Date")\
-                                                        .drop(["Name"], axis=1)\
-                                                        .groupby("Date").sum() \
-                                                        .reset_index()
-    df_overall["Name"] = "Overall Portfolio"
-    df_timeseries = pd.concat([df_grouped_all, df_overall], ignore_index=True, sort=False)
+def _orders_fingerprint(orders: pd.DataFrame) -> str:
+    """
+    Hash of the timeseries relevant columns of orders, used to detect changed or removed orders.
+    """
+    import hashlib
+    row_hashes = pd.util.hash_pandas_object(orders[["Date", "Name", "Investment", "Price", "Ordercost"]], index=False)
+    return(hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest())
+
+def prepare_timeseries_incremental(orders: pd.DataFrame,
+                                   snapshot_path="/home/chris/Dropbox/Finance/data/generated/timeseries_snapshot"):
+    """
+    Computes the same timeseries as prepare_timeseries, but reuses a persisted snapshot of all closed months (every
+    month before the latest transaction month). Only orders after the snapshot are folded into the cumulative state
+    per stock of the snapshot. The snapshot is rebuilt from scratch, if orders inside the snapshot have changed.
+    :param orders: dataframe, containing Investmentamount, ordercost and price for each stock per transactiondate
+    :param snapshot_path: directory of the snapshot (timeseries and cumulative state in Parquet format)
+    :return: dataframe with columns Date, Name, Investment, Ordercost, Value (one row per date and stock,
+             followed by the rows of the overall portfolio with name "Overall Portfolio"), sorted by date
+    """
+    import os
+    import json
+    import numpy as np
+    import pyarrow as pa
+    necessary_columns = ["Date", "Name", "Investment", "Price", "Ordercost"]
+    assert set(orders.columns).intersection(set(necessary_columns)) == set(necessary_columns), \
+        "Necessary columns missing in order data for timeseries preparation!"
+    if len(orders) == 0:
+        return(prepare_timeseries(orders))
+
+    month_dates = _month_dates(orders["Date"])
+    ### The latest month may still get transactions, it is never part of the snapshot
+    snapshot_date = month_dates.max() - pd.DateOffset(months=1)
+    closed_orders = orders[month_dates <= snapshot_date]
+    fingerprint = _orders_fingerprint(closed_orders)
+
+    meta_path = os.path.join(snapshot_path, "meta.json")
+    try:
+        with open(meta_path, "r") as meta_file:
+            meta = json.load(meta_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        meta = {}
+    meta_date = pd.Timestamp(meta["snapshot_date"]) if "snapshot_date" in meta else None
+    snapshot_valid = meta_date is not None and meta_date <= snapshot_date and \
+        meta.get("fingerprint") == _orders_fingerprint(orders[month_dates <= meta_date])
+
+    if snapshot_valid:
+        try:
+            df_snapshot = pd.read_parquet(os.path.join(snapshot_path, meta["timeseries_file"]))
+            df_state = pd.read_parquet(os.path.join(snapshot_path, meta["state_file"])).set_index("Name")
+        except (OSError, KeyError, pa.ArrowException) as e:
+            ### Missing or incomplete snapshot files: the snapshot is rebuilt from all orders
+            logger.warning(f"LOAD: Timeseries snapshot in {snapshot_path} is not readable: {e}")
+            snapshot_valid = False
+    if snapshot_valid:
+        new_orders_mask = month_dates > meta_date
+        logger.info(f"LOAD: Timeseries snapshot until {meta['snapshot_date']} reused, "
+                    f"{new_orders_mask.sum()} new orders are added")
+    else:
+        logger.info("LOAD: No valid timeseries snapshot, timeseries is computed from all orders")
+        df_snapshot = pd.DataFrame(columns=["Date", "Name", "Investment", "Ordercost", "Value"])
+        df_state = None
+        new_orders_mask = pd.Series(True, index=orders.index)
+    (df_stocks, df_overall, df_state_new) = _cumulate_timeseries(orders[new_orders_mask], df_state)
+
+    ### Stocks bought for the first time after the snapshot have no investment and no value at the snapshot dates
+    df_snapshot_stocks = df_snapshot[df_snapshot["Name"] != "Overall Portfolio"]
+    df_snapshot_overall = df_snapshot[df_snapshot["Name"] == "Overall Portfolio"]
+    snapshot_stocks = set(df_snapshot_stocks["Name"])
+    first_bought = [stock for stock in df_state_new.index if stock not in snapshot_stocks]
+    snapshot_dates = df_snapshot_stocks["Date"].drop_duplicates()
+    df_first_bought = pd.DataFrame({"Date": np.repeat(snapshot_dates.values, len(first_bought)),
+                                    "Name": np.tile(np.asarray(first_bought, dtype=object), len(snapshot_dates)),
+                                    "Investment": 0.,
+                                    "Ordercost": 0.,
+                                    "Value": np.nan,
+                                    })
+    df_stocks = pd.concat([df_snapshot_stocks, df_first_bought, df_stocks], ignore_index=True, sort=False)\
+                  .sort_values("Date", kind="mergesort")
+    df_overall = pd.concat([df_snapshot_overall, df_overall], ignore_index=True, sort=False)
+    df_timeseries = pd.concat([df_stocks, df_overall], ignore_index=True, sort=False)
+    df_timeseries["Date"] = pd.to_datetime(df_timeseries["Date"])
+
+    if len(closed_orders) > 0 and (not snapshot_valid or meta_date < snapshot_date):
+        ### Persist all closed months together with the cumulative state at the end of snapshot_date. The meta file
+        ### is replaced last, so that it always refers to a complete snapshot.
+        (_, _, df_state_closed) = _cumulate_timeseries(orders[new_orders_mask & (month_dates <= snapshot_date)],
+                                                       df_state)
+        os.makedirs(snapshot_path, exist_ok=True)
+        suffix = f"{snapshot_date.strftime('%Y-%m')}.{fingerprint[:16]}.parquet"
+        new_meta = {"snapshot_date": snapshot_date.strftime("%Y-%m-%d"),
+                    "fingerprint": fingerprint,
+                    "timeseries_file": "timeseries." + suffix,
+                    "state_file": "state." + suffix,
+                    }
+        for filename, df_file in [(new_meta["timeseries_file"],
+                                   df_timeseries[df_timeseries["Date"] <= snapshot_date].reset_index(drop=True)),
+                                  (new_meta["state_file"], df_state_closed.reset_index())]:
+            tmp_path = os.path.join(snapshot_path, f"{filename}.{os.getpid()}.tmp")
+            df_file.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, os.path.join(snapshot_path, filename))
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as meta_file:
+            json.dump(new_meta, meta_file)
+        os.replace(tmp_path, meta_path)
+        ### Only the files of the replaced snapshot are removed, files of other writers are kept
+        for filename in [meta.get("timeseries_file"), meta.get("state_file")]:
+            if filename is not None and filename not in [new_meta["timeseries_file"], new_meta["state_file"]]:
+                try:
+                    os.remove(os.path.join(snapshot_path, filename))
+                except FileNotFoundError:
+                    pass
     return(df_timeseries)
 
+def load_price_history(price_history_path="/home/chris/Dropbox/Finance/data/datahub/INGEST/stocks/transform/ingest_stocks_etf_prices",
+                       isins=None, start_date=None, end_date=None) -> pd.DataFrame:
+    """
+    Loads the historized prices of the stocks datahub, either from the partitioned price store or from csv.
+    :param price_history_path: root directory of the price store or csv file (separator ";")
+    :param isins: list of ISINs to load, all if None
+    :param start_date: first date to load, no lower bound if None
+    :param end_date: last date to load, no upper bound if None
+    :return: dataframe with columns ISIN, Price, Currency, Date (datetime)
+    """
+    from ..utilities.partitioned_store import PartitionedStore
+
+    if price_history_path.endswith(".csv"):
+        df_prices = pd.read_csv(price_history_path, sep=";")
+        df_prices["Date"] = pd.to_datetime(df_prices["Date"], format="%d.%m.%Y")
+        if isins is not None:
+            df_prices = df_prices[df_prices["ISIN"].isin(isins)]
+        if start_date is not None:
+            df_prices = df_prices[df_prices["Date"] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            df_prices = df_prices[df_prices["Date"] <= pd.Timestamp(end_date)]
+        return(df_prices.reset_index(drop=True))
+    filters = None if isins is None else {"ISIN": list(isins)}
+    return(PartitionedStore(price_history_path).read(start_date, end_date, filters=filters))
+
+def load_crypto_price_history(price_history_path="/home/chris/Dropbox/Finance/data/datahub/INGEST/crypto/transform/ingest_crypto_prices",
+                              symbols=None, start_date=None, end_date=None) -> pd.DataFrame:
+    """
+    Loads the daily price snapshots of cryptocurrencies. Filters on symbols only read the partitions between the
+    first and last date of the symbols (symbol index of the store).
+    :param price_history_path: root directory of the crypto price store
+    :param symbols: list of symbols to load, all if None
+    :param start_date: first date to load, no lower bound if None
+    :param end_date: last date to load, no upper bound if None
+    :return: dataframe with columns of extract_crypto_prices, currency and Date (datetime), sorted by Date
+    """
+    from ..utilities.partitioned_store import PartitionedStore
+
+    filters = None if symbols is None else {"symbol": list(symbols)}
+    return(PartitionedStore(price_history_path, index_column="symbol").read(start_date, end_date, filters=filters))
+
+def compute_daily_portfolio_value(orders: pd.DataFrame, df_price_history: pd.DataFrame,
+                                  fx_rates=None) -> pd.DataFrame:
+    """
+    Mark-to-market valuation of the portfolio on every date of the price history: The cumulative holdings of each
+    stock are joined as-of each price date (latest holdings at or before the date) and valued with the price of
+    that date. Missing prices of a stock are filled with its last known price. Prices, which are not in Euro, are
+    converted with the conversion rate of their date.
+    :param orders: preprocessed orders (see preprocess_orders), needs columns Date, Name, ISIN, Investment, Price
+    :param df_price_history: historized prices (see load_price_history), needs columns Date, ISIN, Price
+    :param fx_rates: FxRates used for the conversion, default: process-wide FxRates without rate store
+    :return: dataframe with columns Date, ISIN, Name, Investment, Value (one row per date and stock held at that
+             date), followed by the rows of the overall portfolio with name "Overall Portfolio". Empty, if there is
+             no price history.
+    """
+    if len(df_price_history) == 0:
+        logger.warning("PROCESSING: No price history available! Portfolio is not valued with market prices.")
+        return(pd.DataFrame({"Date": pd.Series(dtype="datetime64[ns]"),
+                             "ISIN": pd.Series(dtype=object),
+                             "Name": pd.Series(dtype=object),
+                             "Investment": pd.Series(dtype=float),
+                             "Value": pd.Series(dtype=float),
+                             }))
+    needed_columns_orders = set(["Date", "Name", "ISIN", "Investment", "Price"])
+    needed_columns_prices = set(["Date", "ISIN", "Price"])
+    assert needed_columns_orders.intersection(set(orders.columns)) == needed_columns_orders, \
+        "One of the following columns are missing in orders: {}".format(needed_columns_orders)
+    assert needed_columns_prices.intersection(set(df_price_history.columns)) == needed_columns_prices, \
+        "One of the following columns are missing in df_price_history: {}".format(needed_columns_prices)
+    if "Currency" in df_price_history.columns:
+        df_price_history = _convert_prices(df_price_history, "EUR", fx_rates)
+
+    ### Cumulative holdings per stock at each transaction date
+    holdings = orders[["Date", "ISIN", "Investment"]].copy()
+    holdings["Amount"] = orders["Investment"] / orders["Price"]
+    holdings = holdings.groupby(["ISIN", "Date"], observed=True).sum().groupby(level="ISIN").cumsum().reset_index()
+
+    missing_isins = set(holdings["ISIN"]) - set(df_price_history["ISIN"])
+    if len(missing_isins) > 0:
+        logger.warning(f"PROCESSING: No price history for {sorted(missing_isins)}! Stocks are not valued!")
+
+    ### Date x ISIN grid of prices, forward filled for dates, where the price of a stock was not extracted
+    prices = df_price_history.pivot_table(index="Date", columns="ISIN", values="Price", aggfunc="last")\
+                             .ffill()\
+                             .stack()\
+                             .rename("Price")\
+                             .reset_index()\
+                             .sort_values("Date", kind="mergesort")
+    df_daily = pd.merge_asof(prices, holdings.sort_values("Date", kind="mergesort"),
+                             on="Date", by="ISIN", direction="backward")
+    ### Dates before the first transaction of a stock have no holdings
+    df_daily = df_daily[~df_daily["Amount"].isna()]
+    df_daily["Value"] = round(df_daily["Amount"] * df_daily["Price"], 2)
+    df_daily["Name"] = df_daily["ISIN"].map(orders.drop_duplicates("ISIN").set_index("ISIN")["Name"])
+    df_daily = df_daily[["Date", "ISIN", "Name", "Investment", "Value"]].reset_index(drop=True)
+
+    df_overall = df_daily.groupby("Date")[["Investment", "Value"]].sum().reset_index()
+    df_overall["ISIN"] = ""
+    df_overall["Name"] = "Overall Portfolio"
+    return(pd.concat([df_daily, df_overall], ignore_index=True, sort=False))
+
+def normalize_dtypes(df: pd.DataFrame, name="dataframe", max_category_ratio=0.5) -> pd.DataFrame:
+    """
+    Converts the columns of df to compact dtypes: String columns with few distinct values become categoricals and
+    columns holding date or datetime objects become datetime64. The memory usage before and after the conversion is
+    logged. Float columns are kept as float64, they hold amounts, which are aggregated and displayed.
+    Groupbys on the converted columns need observed=True, otherwise unobserved categories create empty groups.
+    :param df: dataframe to convert
+    :param name: name of the dataframe in the memory report
+    :param max_category_ratio: maximum ratio of distinct values to rows of a string column, to convert it to category
+    :return: converted copy of df
+    """
+    memory_before = df.memory_usage(deep=True).sum()
+    df_normalized = df.copy()
+    for column in df_normalized.columns:
+        series = df_normalized[column]
+        if series.dtype != object or len(series) == 0:
+            continue
+        inferred_dtype = pd.api.types.infer_dtype(series, skipna=True)
+        if inferred_dtype in ["date", "datetime", "datetime64"]:
+            df_normalized[column] = pd.to_datetime(series)
+        elif inferred_dtype == "string" and series.nunique() <= max_category_ratio * len(series):
+            df_normalized[column] = series.astype("category")
+    memory_after = df_normalized.memory_usage(deep=True).sum()
+    logger.info(f"PROCESSING: {name}: {memory_before / 1024 ** 2:.2f} MB -> {memory_after / 1024 ** 2:.2f} MB "
+                f"({len(df_normalized)} rows)")
+    return(df_normalized)
@@ -1,21 +1,79 @@
 import os
+import logging
 import pandas as pd
+from ..utilities.utils import file_hash, load_manifest, save_manifest
 
-def update_cashflow_data():
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def update_cashflow_data(base_path="/home/chris/Dropbox/Finance/data/data_cashflow/", csv_path=None):
+    """
+    Consolidates the raw monthly Toshl exports in base_path/raw into a columnar store (base_path/consolidated).
+    A manifest keeps size, modification time and hash of each ingested raw file: Only new or changed files are
+    parsed and stored as Parquet part of the store, parts of deleted raw files are removed.
+    All values are kept as strings, exactly as in the raw files.
+    :param base_path: directory of the cashflow data
+    :param csv_path: if given, the whole consolidated data is additionally written into this csv file
+                     (e.g. base_path/bilanz_full.csv)
+    :return: list of raw filenames, that were (re-)ingested
+    """
+    raw_data_path = os.path.join(base_path, "raw")
+    store_path = os.path.join(base_path, "consolidated")
+    os.makedirs(store_path, exist_ok=True)
+    manifest_path = os.path.join(store_path, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+
+    all_data_filenames = sorted(os.listdir(raw_data_path))
+    ingested_filenames = []
+    for filename in all_data_filenames:
+        file_path = os.path.join(raw_data_path, filename)
+        stat = os.stat(file_path)
+        entry = manifest.get(filename)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            continue
+        raw_hash = file_hash(file_path)
+        if entry is not None and entry["sha256"] == raw_hash:
+            ### File was touched, but not changed
+            entry["mtime_ns"] = stat.st_mtime_ns
+            continue
+
+        df = pd.read_csv(file_path, dtype=str)
+        part_filename = os.path.splitext(filename)[0] + ".parquet"
+        tmp_path = os.path.join(store_path, part_filename + ".tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(store_path, part_filename))
+        manifest[filename] = {"size": stat.st_size,
+                              "mtime_ns": stat.st_mtime_ns,
+                              "sha256": raw_hash,
+                              "rows": len(df),
+                              "part": part_filename,
+                              }
+        ingested_filenames.append(filename)
+        print("Bilanz " + filename[7:14] + ": Number of transactions = ", len(df))
+
+    for filename in [filename for filename in manifest if filename not in all_data_filenames]:
+        logger.info(f"INGEST: CASHFLOW: Raw file {filename} was removed, its data is removed from the store")
+        part_path = os.path.join(store_path, manifest.pop(filename)["part"])
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    save_manifest(manifest_path, manifest)
+    logger.info(f"INGEST: CASHFLOW: {len(ingested_filenames)} of {len(all_data_filenames)} raw files ingested")
+
+    if csv_path is not None:
+        load_consolidated_cashflow(store_path).to_csv(csv_path, index=False)
+    return ingested_filenames
+
+
+def load_consolidated_cashflow(store_path="/home/chris/Dropbox/Finance/data/data_cashflow/consolidated"):
     """
-    Loads all existing raw files of cashflow per month, appends them and saves them in a single csv.
-    :return:
+    Loads the consolidated Toshl exports (see update_cashflow_data) in the order of the raw filenames.
+    :param store_path: directory of the consolidated store
+    :return: dataframe with the columns of the Toshl export, same content as the appended raw files
     """
-    base_path = "/home/chris/Dropbox/Finance/data/data_cashflow/"
-    raw_data_path = os.path.join(base_path, "raw/")
-    out_filename = "bilanz_full"
-
-    all_data_filenames = sorted(os.listdir(path=raw_data_path))
-    for count, filename in enumerate(all_data_filenames):
-        df = pd.read_csv(raw_data_path + filename)
-        if count == 0:
-            df_all = df.copy()
-        elif count > 0:
-            df_all = df_all.append(df)
-        print("Bilanz " + filename[7:14] + ": Number of transactions = ", df.count()[0])
-    df_all.to_csv(base_path + out_filename + ".csv", index=False)
\ No newline at end of file
+    manifest = load_manifest(os.path.join(store_path, MANIFEST_FILENAME))
+    assert len(manifest) > 0, f"INGEST: CASHFLOW: No consolidated cashflow data in {store_path}!"
+    parts = [pd.read_parquet(os.path.join(store_path, manifest[filename]["part"]))
+             for filename in sorted(manifest.keys())]
+    return pd.concat(parts, ignore_index=True, sort=False)
@@ -0,0 +1,101 @@
+import time
+import logging
+import threading
+import requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from .http_cache import cached_request
+
+logger = logging.getLogger(__name__)
+
+
+class HostRateLimiter:
+    """
+    Thread-safe rate limiter, that spaces out the start of requests against the same host.
+    Each host gets its own schedule, so requests against different hosts do not block each other.
+    """
+    def __init__(self, requests_per_second: float):
+        self.min_interval = 1. / requests_per_second if requests_per_second else 0.
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url: str):
+        """
+        Blocks until the next request slot for the host of url is reached.
+        :param url: URL that should be requested
+        """
+        if self.min_interval == 0.:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def create_session(max_workers: int) -> requests.Session:
+    """
+    Creates a requests session, whose connection pool is large enough to be shared by max_workers threads.
+    :param max_workers: number of threads using the session concurrently
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_pages(urls: dict, max_workers=8, requests_per_second=2., method="GET", timeout=30, cache=None, ttl=0):
+    """
+    Fetches all given urls concurrently with a bounded thread pool and a per-host rate limit.
+    A failing request does not abort the whole batch, its error message is collected instead.
+    :param urls: dictionary key:url, the key is used to identify the page in the output (e.g. an ISIN)
+    :param max_workers: maximum number of concurrent requests
+    :param requests_per_second: maximum number of requests started per second against a single host
+    :param method: HTTP method used for all requests
+    :param timeout: timeout in seconds of a single request
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of cached responses in seconds, either a single value or a dictionary key:ttl
+    :return: tuple of dictionaries (key:decoded page content, key:error message), both in the order of urls
+    """
+    limiter = HostRateLimiter(requests_per_second)
+    session = create_session(max_workers)
+
+    def fetch(key):
+        url = urls[key]
+        key_ttl = ttl.get(key, 0) if isinstance(ttl, dict) else ttl
+        try:
+            lookup = None
+            if cache is not None:
+                ### Cache hits are served without waiting for the rate limiter, the entry is passed on to the request
+                lookup = cache.lookup(method, url, key_ttl)
+                if lookup[2] is not None:
+                    return lookup[2].decode("utf-8"), None
+            limiter.wait(url)
+            status_code, content = cached_request(method, url, cache=cache, ttl=key_ttl,
+                                                  session=session, timeout=timeout, lookup=lookup)
+            if status_code != requests.codes.ok:
+                return None, f"HTTP Error, {status_code}"
+            return content.decode("utf-8"), None
+        ### A failing page (network, undecodable content or cache I/O) must not abort the whole batch
+        except requests.RequestException as e:
+            return None, f"Request failed: {e}"
+        except UnicodeDecodeError as e:
+            return None, f"Content is not UTF-8: {e}"
+        except OSError as e:
+            return None, f"Cache error: {e}"
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(fetch, urls.keys()))
+
+    pages, failures = {}, {}
+    for key, (content, error) in zip(urls.keys(), results):
+        if error is None:
+            pages[key] = content
+        else:
+            logger.warning(f"EXTRACT: {key}: {error}")
+            failures[key] = error
+    return pages, failures
@@ -0,0 +1,228 @@
+import os
+import json
+import logging
+import threading
+import functools
+import requests
+import numpy as np
+import pandas as pd
+from datetime import date
+from .http_cache import cached_request
+
+logger = logging.getLogger(__name__)
+
+FX_RATE_URL = "https://www.finanzen.net/ajax/currencyConverter_Exchangerate/{base}/{quote}/{day}"
+
+
+def fetch_conversion_rate(base: str, quote: str, day: pd.Timestamp, cache=None, ttl=0) -> float:
+    """
+    Uses https://www.finanzen.net to get the conversion rate of base into quote currency at the given date.
+    :param base: currency to convert from, e.g. "USD"
+    :param quote: currency to convert to, e.g. "EUR"
+    :param day: date of the conversion rate
+    :param cache: HttpCache used to serve and store responses, no caching if None
+    :param ttl: time to live of a cached conversion rate in seconds
+    :return: conversion rate (1 base = rate quote)
+    """
+    url = FX_RATE_URL.format(base=base, quote=quote, day=day.strftime("%Y-%m-%d"))
+    status_code, content = cached_request("POST", url, cache=cache, ttl=ttl)
+    assert status_code == requests.codes.ok, f"FX: Could not convert {base} to {quote}!"
+    return float(json.loads(content)[0])
+
+
+class FxRates:
+    """
+    Conversion rates per date and currency pair. Rates are looked up in an in-process memo first, then in the
+    local rate store (a single Parquet file with columns Date, base, quote, rate) and are only fetched, if neither
+    holds them. Rates of past dates never change and are persisted in the store. A rate fetched before the end of
+    its date (intraday rate) is kept in the memo for intraday_ttl seconds only and is fetched again as final rate
+    after the date ended. Dates, whose rate could not be fetched, are not requested again in the process (the
+    current date after intraday_ttl seconds). The rate of a pair is also served by the inverse of the opposite pair.
+    """
+    def __init__(self, store_path=None, cache=None, ttl=0, intraday_ttl=3600, fetch_function=fetch_conversion_rate):
+        """
+        :param store_path: path of the Parquet file of the rate store, only the memo is used if None
+        :param cache: HttpCache used for the rate requests, no caching if None
+        :param ttl: time to live of cached rate responses in seconds
+        :param intraday_ttl: time in seconds, a memoized rate of the current date is valid
+        :param fetch_function: function (base, quote, day, cache, ttl) returning the rate of a date
+        """
+        self.store_path = store_path
+        self.cache = cache
+        self.ttl = ttl
+        self.intraday_ttl = intraday_ttl
+        self.fetch_function = fetch_function
+        self._rates = {}
+        self._fetched_at = {}
+        self._failed_at = {}
+        self._store_loaded = False
+        self._unsaved = False
+        self._lock = threading.Lock()
+
+    def _load_store(self):
+        self._store_loaded = True
+        if self.store_path is None or not os.path.exists(self.store_path):
+            return
+        df_store = pd.read_parquet(self.store_path)
+        for day, base, quote, rate in zip(df_store["Date"], df_store["base"], df_store["quote"], df_store["rate"]):
+            self._rates.setdefault((base, quote, pd.Timestamp(day)), float(rate))
+
+    def _save_store(self):
+        """
+        Persists all memoized rates of past dates. Rates, which were stored by another process in the meantime, are
+        kept.
+        """
+        df_new = pd.DataFrame([(day, base, quote, rate) for (base, quote, day), rate in self._rates.items()
+                               if (base, quote, day) not in self._fetched_at],
+                              columns=["Date", "base", "quote", "rate"])
+        if os.path.exists(self.store_path):
+            df_new = pd.concat([pd.read_parquet(self.store_path), df_new], ignore_index=True)
+        df_new = df_new.drop_duplicates(["Date", "base", "quote"], keep="last")\
+                       .sort_values(["base", "quote", "Date"])\
+                       .reset_index(drop=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.store_path)), exist_ok=True)
+        tmp_path = self.store_path + ".tmp"
+        df_new.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.store_path)
+        self._unsaved = False
+
+    def _is_expired(self, fetched_at: pd.Timestamp, day: pd.Timestamp) -> bool:
+        """
+        Checks whether an intraday rate or an intraday failure (fetched at fetched_at) of day is outdated: after
+        intraday_ttl seconds or as soon as day ended.
+        """
+        now = pd.Timestamp.now()
+        return (now - fetched_at).total_seconds() >= self.intraday_ttl or now >= day + pd.Timedelta(days=1)
+
+    def _lookup(self, base: str, quote: str, day: pd.Timestamp):
+        for key, invert in [((base, quote, day), False), ((quote, base, day), True)]:
+            if key not in self._rates:
+                continue
+            if key in self._fetched_at and self._is_expired(self._fetched_at[key], day):
+                continue
+            return 1. / self._rates[key] if invert else self._rates[key]
+        return None
+
+    def _fetch(self, base: str, quote: str, day: pd.Timestamp) -> bool:
+        """
+        Fetches the rate of day into the memo. Failed requests are memoized as well.
+        :return: boolean, whether the rate was fetched
+        """
+        key = (base, quote, day)
+        failed_at = self._failed_at.get(key)
+        ### Requests failed after the end of day are final, intraday failures are retried once they are outdated
+        if failed_at is not None and (failed_at >= day + pd.Timedelta(days=1) or not self._is_expired(failed_at, day)):
+            return False
+        fetched_at = pd.Timestamp.now()
+        try:
+            self._rates[key] = self.fetch_function(base, quote, day, cache=self.cache, ttl=self.ttl)
+        except (AssertionError, ValueError, IndexError, requests.RequestException) as e:
+            logger.warning(f"FX: Rate {base}/{quote} of {day.date()} could not be extracted: {e}")
+            self._failed_at[key] = fetched_at
+            return False
+        self._failed_at.pop(key, None)
+        if fetched_at < day + pd.Timedelta(days=1):
+            self._fetched_at[key] = fetched_at
+        else:
+            ### Final rate of a past date
+            self._fetched_at.pop(key, None)
+            self._unsaved = True
+        return True
+
+    def _known_rates(self, base: str, quote: str) -> pd.Series:
+        """
+        :return: all memoized rates of the pair (directly or inverted) as series indexed by date
+        """
+        known = {day: rate for (b, q, day), rate in self._rates.items() if (b, q) == (base, quote)}
+        known.update({day: 1. / rate for (b, q, day), rate in self._rates.items()
+                      if (b, q) == (quote, base) and day not in known})
+        return pd.Series(known, dtype=float).sort_index()
+
+    def rates(self, base: str, quote: str, dates) -> pd.Series:
+        """
+        Conversion rates of base into quote currency for each element of dates. Each distinct date is looked up
+        (or fetched) once. If the rate of a date cannot be fetched, the latest known rate before that date is used.
+        :param base: currency to convert from
+        :param quote: currency to convert to
+        :param dates: list or series of dates (pd.Timestamp, datetime.date or ISO strings)
+        :return: series of rates with the index of dates (if it is a series)
+        """
+        days = pd.to_datetime(pd.Series(dates)).dt.normalize()
+        if base == quote:
+            return pd.Series(1., index=days.index)
+        missing_days = []
+        with self._lock:
+            if not self._store_loaded:
+                self._load_store()
+            for day in days.drop_duplicates():
+                if self._lookup(base, quote, day) is None and not self._fetch(base, quote, day):
+                    missing_days.append(day)
+            known = self._known_rates(base, quote)
+            if self._unsaved and self.store_path is not None:
+                self._save_store()
+
+        ### Fetched dates map directly, failed dates fall back to the latest rate before them
+        rates = days.map(known)
+        if len(missing_days) > 0 and len(known) > 0:
+            fallback = known.asof(pd.DatetimeIndex(missing_days))
+            rates = rates.fillna(days.map(pd.Series(fallback.to_numpy(), index=missing_days)))
+        assert not rates.isna().any(), f"FX: No rate {base}/{quote} for {sorted(set(days[rates.isna()].dt.date))}!"
+        return rates
+
+    def rate(self, base: str, quote: str, day=None) -> float:
+        """
+        :param base: currency to convert from
+        :param quote: currency to convert to
+        :param day: date of the rate, today if None
+        :return: conversion rate (1 base = rate quote)
+        """
+        day = date.today() if day is None else day
+        return float(self.rates(base, quote, [day]).iloc[0])
+
+    def convert(self, df: pd.DataFrame, columns: list, to_currency: str, currency_column=None, from_currency=None,
+                date_column=None, date_format="%d.%m.%Y") -> pd.DataFrame:
+        """
+        Converts the amounts in columns into to_currency, each row with the rate of its currency and date. The rates
+        are resolved once per currency and distinct date, the conversion itself is a vectorized multiplication.
+        :param df: dataframe holding the amounts
+        :param columns: list of amount columns to convert
+        :param to_currency: currency to convert to
+        :param currency_column: column holding the currency of each row, is set to to_currency
+        :param from_currency: currency of all rows, if currency_column is None
+        :param date_column: column holding the date of each row, current rates are used if None
+        :param date_format: format of date_column, if it is given as string
+        :return: copy of df with converted amounts
+        """
+        assert (currency_column is None) != (from_currency is None), \
+            "FX: Either currency_column or from_currency has to be given!"
+        df = df.copy()
+        if currency_column is not None:
+            currencies = df[currency_column].astype(str)
+        else:
+            currencies = pd.Series(from_currency, index=df.index)
+        if date_column is None:
+            days = pd.Series(pd.Timestamp(date.today()), index=df.index)
+        elif pd.api.types.is_datetime64_any_dtype(df[date_column]):
+            days = df[date_column]
+        else:
+            days = pd.to_datetime(df[date_column], format=date_format)
+
+        factors = np.ones(len(df))
+        for currency in currencies.unique():
+            mask = (currencies == currency).to_numpy()
+            factors[mask] = self.rates(currency, to_currency, days[mask]).to_numpy()
+        for column in columns:
+            df[column] = df[column] * factors
+        if currency_column is not None:
+            df[currency_column] = to_currency
+        return df
+
+
+@functools.lru_cache(maxsize=None)
+def default_fx_rates(cache=None, ttl=0) -> FxRates:
+    """
+    :param cache: HttpCache used for the rate requests, no caching if None
+    :param ttl: time to live of cached rate responses in seconds
+    :return: process-wide FxRates without rate store, one instance per cache and ttl
+    """
+    return FxRates(cache=cache, ttl=ttl)
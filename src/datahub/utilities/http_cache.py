@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class HttpCache:
+    """
+    On-disk cache of HTTP responses. Each request (method + url) has an entry file holding the response metadata,
+    the response bodies are stored content-addressed (by their sha256 hash) in a separate directory.
+    Fresh entries (younger than the TTL of a request) are served without network access, stale entries are
+    revalidated with ETag/If-Modified-Since headers. Least recently used entries are evicted, as soon as the size
+    of all stored responses exceeds max_size_mb, until it is below evict_to_ratio * max_size_mb. The size is kept
+    as running total, the cache directory is only scanned for an eviction.
+    """
+    def __init__(self, cache_dir: str, max_size_mb=200, evict_to_ratio=0.9):
+        self.cache_dir = cache_dir
+        self.entry_dir = os.path.join(cache_dir, "entries")
+        self.content_dir = os.path.join(cache_dir, "content")
+        self.max_size_bytes = int(max_size_mb * 1024 ** 2)
+        self.evict_to_bytes = int(evict_to_ratio * self.max_size_bytes)
+        self._total_size = None
+        self._lock = threading.Lock()
+        os.makedirs(self.entry_dir, exist_ok=True)
+        os.makedirs(self.content_dir, exist_ok=True)
+
+    def _entry_path(self, method: str, url: str) -> str:
+        key = hashlib.sha256(f"{method.upper()} {url}".encode("utf-8")).hexdigest()
+        return os.path.join(self.entry_dir, key + ".json")
+
+    def _load_entry(self, entry_path: str):
+        try:
+            with open(entry_path, "r") as entry_file:
+                return json.load(entry_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _read_content(self, entry: dict):
+        try:
+            with open(os.path.join(self.content_dir, entry["content_hash"]), "rb") as content_file:
+                return content_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_atomic(self, path: str, data: bytes):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+
+    def _store(self, entry_path: str, entry: dict, content: bytes):
+        content_hash = hashlib.sha256(content).hexdigest()
+        content_path = os.path.join(self.content_dir, content_hash)
+        if not os.path.exists(content_path):
+            self._write_atomic(content_path, content)
+            if self._total_size is not None:
+                self._total_size += len(content)
+        entry["content_hash"] = content_hash
+        entry["size"] = len(content)
+        self._write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+
+    def lookup(self, method: str, url: str, ttl: float) -> tuple:
+        """
+        Loads the entry of a request, the result can be passed to request, so that the entry is loaded only once.
+        :param method: HTTP method of the request
+        :param url: url of the request
+        :param ttl: time to live of the cached response in seconds
+        :return: tuple (entry path, entry or None, response body as bytes, if it is younger than ttl seconds, or None)
+        """
+        entry_path = self._entry_path(method, url)
+        entry = self._load_entry(entry_path)
+        if entry is None or time.time() - entry["fetched_at"] >= ttl:
+            return entry_path, entry, None
+        content = self._read_content(entry)
+        if content is not None:
+            # Update access time of the entry for the LRU eviction
+            try:
+                os.utime(entry_path)
+            except FileNotFoundError:
+                pass
+        return entry_path, entry, content
+
+    def get(self, method: str, url: str, ttl: float):
+        """
+        Returns the cached response body, if it is younger than ttl seconds.
+        :param method: HTTP method of the request
+        :param url: url of the request
+        :param ttl: time to live of the cached response in seconds
+        :return: response body as bytes or None
+        """
+        return self.lookup(method, url, ttl)[2]
+
+    def request(self, session, method: str, url: str, ttl: float, timeout=30, lookup=None):
+        """
+        Executes a request through the cache: Fresh responses are returned from disk, stale responses are
+        revalidated with conditional headers and new responses are stored.
+        :param session: requests.Session or the requests module
+        :param method: HTTP method of the request
+        :param url: url of the request
+        :param ttl: time to live of the cached response in seconds
+        :param timeout: timeout in seconds of the request
+        :param lookup: result of lookup for this request, it is looked up if None
+        :return: tuple (HTTP status code, response body as bytes)
+        """
+        entry_path, entry, content = self.lookup(method, url, ttl) if lookup is None else lookup
+        if content is not None:
+            logger.debug(f"CACHE: Hit for {url}")
+            return requests.codes.ok, content
+
+        cached_content = self._read_content(entry) if entry is not None else None
+        headers = {}
+        if cached_content is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        r = session.request(method, url, headers=headers, timeout=timeout)
+        if r.status_code == requests.codes.not_modified and cached_content is not None:
+            logger.debug(f"CACHE: Revalidated {url}")
+            entry["fetched_at"] = time.time()
+            self._write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+            return requests.codes.ok, cached_content
+        if r.status_code == requests.codes.ok:
+            # Storing holds the lock, otherwise a concurrent eviction could remove the new body before its entry
+            # is written
+            with self._lock:
+                self._store(entry_path,
+                            {"method": method.upper(),
+                             "url": url,
+                             "fetched_at": time.time(),
+                             "etag": r.headers.get("ETag"),
+                             "last_modified": r.headers.get("Last-Modified"),
+                             },
+                            r.content,
+                            )
+            self.evict()
+        return r.status_code, r.content
+
+    def _size(self) -> int:
+        if self._total_size is None:
+            self._total_size = sum(os.path.getsize(os.path.join(self.content_dir, content_hash))
+                                   for content_hash in os.listdir(self.content_dir)
+                                   if not content_hash.endswith(".tmp"))
+        return self._total_size
+
+    def evict(self):
+        """
+        If the size of all stored responses exceeds max_size_bytes, least recently used entries and unreferenced
+        response bodies are removed until the size is below evict_to_bytes.
+        """
+        with self._lock:
+            if self._size() <= self.max_size_bytes:
+                return
+            entries = []
+            for filename in os.listdir(self.entry_dir):
+                if not filename.endswith(".json"):
+                    continue
+                entry_path = os.path.join(self.entry_dir, filename)
+                entry = self._load_entry(entry_path)
+                if entry is not None:
+                    entries.append((os.path.getmtime(entry_path), entry_path, entry))
+            entries.sort(key=lambda item: item[0])
+            references = {}
+            for _, _, entry in entries:
+                references[entry["content_hash"]] = references.get(entry["content_hash"], 0) + 1
+            sizes = {content_hash: os.path.getsize(os.path.join(self.content_dir, content_hash))
+                     for content_hash in os.listdir(self.content_dir) if not content_hash.endswith(".tmp")}
+            total_size = sum(sizes.values())
+            ### Remove bodies, that are not referenced by any entry anymore
+            for content_hash in list(sizes.keys()):
+                if content_hash not in references:
+                    os.remove(os.path.join(self.content_dir, content_hash))
+                    total_size -= sizes.pop(content_hash)
+            for _, entry_path, entry in entries:
+                if total_size <= self.evict_to_bytes:
+                    break
+                os.remove(entry_path)
+                content_hash = entry["content_hash"]
+                references[content_hash] -= 1
+                if references[content_hash] == 0 and content_hash in sizes:
+                    os.remove(os.path.join(self.content_dir, content_hash))
+                    total_size -= sizes.pop(content_hash)
+                logger.debug(f"CACHE: Evicted {entry['url']}")
+            self._total_size = total_size
+
+
+def cached_request(method: str, url: str, cache=None, ttl=0, session=None, timeout=30, lookup=None):
+    """
+    Executes a request either through the given HttpCache or directly, if no cache is given.
+    :param method: HTTP method of the request
+    :param url: url of the request
+    :param cache: HttpCache or None
+    :param ttl: time to live of the cached response in seconds
+    :param session: requests.Session, per default the requests module is used
+    :param timeout: timeout in seconds of the request
+    :param lookup: result of HttpCache.lookup for this request, it is looked up if None
+    :return: tuple (HTTP status code, response body as bytes)
+    """
+    session = requests if session is None else session
+    if cache is None:
+        r = session.request(method, url, timeout=timeout)
+        return r.status_code, r.content
+    return cache.request(session, method, url, ttl, timeout=timeout, lookup=lookup)
@@ -0,0 +1,193 @@
+import os
+import json
+import logging
+import pandas as pd
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionedStore:
+    """
+    Append-only store of a timeseries dataframe, partitioned by month and date in Parquet format:
+        base_path/month=YYYY-MM/date=YYYY-MM-DD.parquet
+    The file layout is the index of the store: Whether data of a date exists is a single path lookup and reads
+    only open the partitions inside the requested date range. Filters on other columns are pushed down to the
+    Parquet reader. Existing partitions are never rewritten.
+    Optionally, the store keeps an index of an identifier column (e.g. a symbol): the first and last date of each
+    value. Reads filtered on this column only open the partitions between these dates.
+    """
+    def __init__(self, base_path: str, date_column="Date", date_format="%d.%m.%Y", index_column=None):
+        """
+        :param base_path: root directory of the store
+        :param date_column: column holding the date of each row, used for partitioning
+        :param date_format: format of date_column, if it is given as string
+        :param index_column: column, whose date range per value is indexed, no index if None
+        """
+        self.base_path = base_path
+        self.date_column = date_column
+        self.date_format = date_format
+        self.index_column = index_column
+
+    def _partition_path(self, day: pd.Timestamp) -> str:
+        return os.path.join(self.base_path,
+                            f"month={day.strftime('%Y-%m')}",
+                            f"date={day.strftime('%Y-%m-%d')}.parquet",
+                            )
+
+    def _to_timestamp(self, day) -> pd.Timestamp:
+        if isinstance(day, str):
+            try:
+                return pd.to_datetime(day, format=self.date_format)
+            except ValueError:
+                ### e.g. ISO dates as used in the partition paths
+                return pd.Timestamp(day).normalize()
+        return pd.Timestamp(day).normalize()
+
+    def has_date(self, day) -> bool:
+        """
+        Checks whether data of the given date already exists in the store.
+        :param day: date as string (in date_format or ISO format), datetime.date or pd.Timestamp
+        :return: boolean
+        """
+        return os.path.exists(self._partition_path(self._to_timestamp(day)))
+
+    def _partition_files(self, start_date=None, end_date=None) -> list:
+        """
+        Lists all partition files inside the given date range (inclusive), sorted by date.
+        """
+        if not os.path.isdir(self.base_path):
+            return []
+        start_date = None if start_date is None else self._to_timestamp(start_date)
+        end_date = None if end_date is None else self._to_timestamp(end_date)
+        files = []
+        for month_dir in sorted(os.listdir(self.base_path)):
+            if not month_dir.startswith("month="):
+                continue
+            month = pd.Timestamp(month_dir[len("month="):] + "-01")
+            if (start_date is not None and month + pd.offsets.MonthEnd(0) < start_date) or \
+                    (end_date is not None and month > end_date):
+                continue
+            for filename in sorted(os.listdir(os.path.join(self.base_path, month_dir))):
+                if not (filename.startswith("date=") and filename.endswith(".parquet")):
+                    continue
+                day = pd.Timestamp(filename[len("date="):-len(".parquet")])
+                if (start_date is None or day >= start_date) and (end_date is None or day <= end_date):
+                    files.append(os.path.join(self.base_path, month_dir, filename))
+        return files
+
+    def dates(self) -> list:
+        """
+        :return: sorted list of all dates (pd.Timestamp) in the store
+        """
+        return [pd.Timestamp(os.path.basename(path)[len("date="):-len(".parquet")])
+                for path in self._partition_files()]
+
+    def _index_path(self) -> str:
+        return os.path.join(self.base_path, f"_index_{self.index_column}.json")
+
+    def _load_index(self) -> dict:
+        """
+        Loads the index {"last_date": latest indexed date, "partitions": number of indexed partitions,
+        "values": value:[first date, last date]} (dates in ISO format). The indexed partitions are all partitions
+        up to last_date: Newer partitions (e.g. written by a crashed run or a store without index_column) are added
+        to the index. If the number of partitions up to last_date changed or the index is missing, it is rebuilt.
+        """
+        try:
+            with open(self._index_path(), "r") as index_file:
+                index = json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = {}
+        partitions = {os.path.basename(path)[len("date="):-len(".parquet")]: path for path in self._partition_files()}
+        last_date = index.get("last_date")
+        if last_date is None or sum(day <= last_date for day in partitions) != index.get("partitions"):
+            index = {"last_date": None, "partitions": 0, "values": {}}
+        new_dates = sorted(day for day in partitions if index["last_date"] is None or day > index["last_date"])
+        for day in new_dates:
+            values = pq.read_table(partitions[day], columns=[self.index_column]).column(0).to_pylist()
+            self._update_index(index, day, values)
+        if len(new_dates) > 0:
+            logger.info(f"STORE: {len(new_dates)} partitions added to the index of {self.index_column} "
+                        f"for {self.base_path}")
+            self._save_index(index)
+        return index
+
+    def _update_index(self, index: dict, day: str, values):
+        for value in set(values):
+            first_day, last_day = index["values"].get(str(value), (day, day))
+            index["values"][str(value)] = [min(first_day, day), max(last_day, day)]
+        index["partitions"] += 1
+        index["last_date"] = day if index["last_date"] is None else max(index["last_date"], day)
+
+    def _save_index(self, index: dict):
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump(index, index_file)
+        os.replace(tmp_path, self._index_path())
+
+    def append(self, df: pd.DataFrame) -> list:
+        """
+        Appends the rows of df to the store, one partition per date. Dates, that already exist in the store, are
+        skipped.
+        :param df: dataframe holding date_column
+        :return: list of dates (pd.Timestamp), that were written
+        """
+        assert self.date_column in df.columns, f"STORE: Column {self.date_column} is missing!"
+        assert self.index_column is None or self.index_column in df.columns, \
+            f"STORE: Column {self.index_column} is missing!"
+        df = df.copy()
+        index = self._load_index() if self.index_column is not None else None
+        if not pd.api.types.is_datetime64_any_dtype(df[self.date_column]):
+            df[self.date_column] = pd.to_datetime(df[self.date_column], format=self.date_format)
+        written_dates = []
+        for day, df_day in df.groupby(df[self.date_column].dt.normalize()):
+            partition_path = self._partition_path(day)
+            if os.path.exists(partition_path):
+                logger.warning(f"STORE: Data for {day.date()} already exists in {self.base_path}! Skipped!")
+                continue
+            os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+            if self.index_column is not None:
+                ### Rows sorted by the index column keep the row group statistics of the Parquet files selective
+                df_day = df_day.sort_values(self.index_column, kind="mergesort")
+            tmp_path = partition_path + ".tmp"
+            df_day.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, partition_path)
+            written_dates.append(day)
+            if index is not None:
+                self._update_index(index, day.strftime("%Y-%m-%d"), df_day[self.index_column])
+        if index is not None and len(written_dates) > 0:
+            self._save_index(index)
+        return written_dates
+
+    def read(self, start_date=None, end_date=None, filters=None, columns=None) -> pd.DataFrame:
+        """
+        Reads all rows inside the given date range (inclusive). Only the partitions of the date range are opened.
+        :param start_date: first date to read (string in date_format or ISO format, date), no lower bound if None
+        :param end_date: last date to read (string in date_format or ISO format, date), no upper bound if None
+        :param filters: dictionary column:list of values, pushed down to the Parquet reader. A filter on index_column
+                        additionally limits the date range to the dates of the filtered values.
+        :param columns: list of columns to read, all columns if None
+        :return: dataframe sorted by date_column
+        """
+        if filters and self.index_column in filters:
+            index = self._load_index()["values"]
+            date_ranges = [index[str(value)] for value in filters[self.index_column] if str(value) in index]
+            if len(date_ranges) == 0:
+                files = []
+            else:
+                first_day = pd.Timestamp(min(date_range[0] for date_range in date_ranges))
+                last_day = pd.Timestamp(max(date_range[1] for date_range in date_ranges))
+                start_date = first_day if start_date is None else max(self._to_timestamp(start_date), first_day)
+                end_date = last_day if end_date is None else min(self._to_timestamp(end_date), last_day)
+                files = self._partition_files(start_date, end_date) if start_date <= end_date else []
+        else:
+            files = self._partition_files(start_date, end_date)
+        if len(files) == 0:
+            return pd.DataFrame(columns=columns if columns is not None else [self.date_column])
+        if columns is not None and self.date_column not in columns:
+            columns = [self.date_column] + list(columns)
+        parquet_filters = None
+        if filters:
+            parquet_filters = [(column, "in", list(values)) for column, values in filters.items()]
+        table = pq.read_table(files, columns=columns, filters=parquet_filters, partitioning=None)
+        return table.to_pandas().sort_values(self.date_column, kind="mergesort").reset_index(drop=True)
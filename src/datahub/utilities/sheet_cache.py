@@ -0,0 +1,76 @@
+import os
+import re
+import logging
+import pandas as pd
+import pyarrow as pa
+from .utils import file_hash, load_manifest, save_manifest
+
+logger = logging.getLogger(__name__)
+
+
+def _is_valid(manifest: dict, file_path: str, sheet_names: list) -> bool:
+    """
+    Checks whether the cached sheets in the manifest belong to the current version of the workbook. A changed
+    modification time alone does not invalidate the cache, as long as the content hash is unchanged.
+    """
+    if not all(str(sheet) in manifest.get("sheets", {}) for sheet in sheet_names):
+        return False
+    stat = os.stat(file_path)
+    if manifest.get("mtime_ns") == stat.st_mtime_ns and manifest.get("size") == stat.st_size:
+        return True
+    if manifest.get("sha256") == file_hash(file_path):
+        manifest["mtime_ns"], manifest["size"] = stat.st_mtime_ns, stat.st_size
+        return True
+    return False
+
+
+def load_workbook_cached(file_path: str, sheet_names: list, cache_dir=None) -> dict:
+    """
+    Needs odfpy library to load .ods files!
+    Loads the given sheets of a workbook. All sheets are parsed in a single pass and stored in Feather format,
+    subsequent calls read the Feather files as long as the workbook is unchanged (same modification time and size
+    or same content hash).
+    :param file_path: path to the workbook (.ods)
+    :param sheet_names: list of sheet names (or sheet positions) to load
+    :param cache_dir: directory of the Feather files, default: directory .sheet_cache next to the workbook
+    :return: dictionary sheet name:pd.DataFrame
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), ".sheet_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    base_name = os.path.basename(file_path)
+    manifest_path = os.path.join(cache_dir, base_name + ".json")
+    manifest = load_manifest(manifest_path)
+
+    if _is_valid(manifest, file_path, sheet_names):
+        try:
+            sheets = {sheet: pd.read_feather(os.path.join(cache_dir, manifest["sheets"][str(sheet)]))
+                      for sheet in sheet_names}
+            save_manifest(manifest_path, manifest)
+            return sheets
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"CACHE: Cached sheets of {file_path} are not readable, workbook is parsed: {e}")
+
+    stat = os.stat(file_path)
+    workbook_hash = file_hash(file_path)
+    sheets = pd.read_excel(file_path, sheet_name=list(sheet_names), engine="odf")
+
+    ### Keep cached sheets of the same workbook version, that were not requested this time
+    cached_sheets = manifest.get("sheets", {}) if manifest.get("sha256") == workbook_hash else {}
+    manifest = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": workbook_hash, "sheets": cached_sheets}
+    for sheet, df in sheets.items():
+        sheet_file = f"{base_name}.{re.sub('[^A-Za-z0-9_-]', '_', str(sheet))}.{workbook_hash[:16]}.feather"
+        try:
+            df.to_feather(os.path.join(cache_dir, sheet_file))
+        except (ValueError, TypeError, pa.ArrowException) as e:
+            # e.g. columns with mixed types or non-string column names can not be stored in Feather format
+            logger.warning(f"CACHE: Sheet {sheet} of {file_path} can not be cached: {e}")
+            continue
+        manifest["sheets"][str(sheet)] = sheet_file
+    ### Remove Feather files of older versions of the workbook
+    for filename in os.listdir(cache_dir):
+        if filename.startswith(base_name + ".") and filename.endswith(".feather") and \
+                filename not in manifest["sheets"].values():
+            os.remove(os.path.join(cache_dir, filename))
+    save_manifest(manifest_path, manifest)
+    return sheets
@@ -1,5 +1,6 @@
 import os
 import json
+import hashlib
 import pandas as pd
 import logging
 
@@ -11,6 +12,42 @@ def load_json(file_path):
         return json.load(json_file)
 
 
+def file_hash(file_path: str) -> str:
+    """
+    :param file_path: path to a file
+    :return: sha256 hash of the file content (hex)
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 ** 2), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    :param manifest_path: path to a json manifest (e.g. of a cache or store)
+    :return: content of the manifest, empty dictionary if it is missing or not readable
+    """
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    """
+    Writes the manifest atomically, readers never see a partially written file.
+    :param manifest_path: path to the json manifest
+    :param manifest: dictionary to save
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
 def load_data(file_path, sheet_name=None, separator=";", force_csv=False):
     """
     Needs odfpy library to load .ods files!
@@ -1,8 +1,11 @@
 from datahub.datahub_crypto.extract_crypto_data import extract_crypto_prices
 from datahub.datahub_crypto.transform_crypto_data import transform_crypto_prices
-from datahub.datahub_stocks.extract_stocks_data import extract_etf_master_data, extract_etf_price_data
-from datahub.datahub_stocks.transform_stocks_data import transform_etf_master, transform_historization_etf_prices
+from datahub.datahub_stocks.extract_stocks_data import extract_etf_data
+from datahub.datahub_stocks.transform_stocks_data import get_isins_to_refresh, transform_etf_master, \
+    transform_historization_etf_prices
 from datahub.utilities.utils import load_json, load_data
+from datahub.utilities.http_cache import HttpCache
+from datahub.utilities.fx_rates import FxRates
 
 file_path_config = "datahub/meta_datahub.json"
 DATAHUB_CONFIG = load_json(file_path_config)
@@ -13,6 +16,16 @@ DATAHUB_INGEST_PATH = "/".join([DATAHUB_CONFIG["datahubMeta"]["datahubBasePath"]
                                 DATAHUB_CONFIG["datahubMeta"]["ingestStageName"]
                                 ])
 ETF_SOURCE_URL = DATAHUB_CONFIG["webTools"]["stockMasterSourceUrl"]
+MAX_WORKERS = DATAHUB_CONFIG["webTools"]["maxWorkers"]
+REQUESTS_PER_SECOND = DATAHUB_CONFIG["webTools"]["requestsPerSecondPerHost"]
+HTML_PARSER = DATAHUB_CONFIG["webTools"]["htmlParser"]
+MASTER_MAX_AGE_DAYS = DATAHUB_CONFIG["webTools"]["stockMasterMaxAgeDays"]
+CACHE_TTL = DATAHUB_CONFIG["httpCache"]["ttlSeconds"]
+HTTP_CACHE = HttpCache("/".join([DATAHUB_CONFIG["datahubMeta"]["datahubBasePath"],
+                                 DATAHUB_CONFIG["httpCache"]["cacheStageName"]
+                                 ]),
+                       max_size_mb=DATAHUB_CONFIG["httpCache"]["maxSizeMB"],
+                       )
 
 # Set source-data paths
 filepath_etf_list = "/".join([DATAHUB_SOURCE_PATH,
@@ -39,39 +52,75 @@ filepath_etf_prices = "/".join([DATAHUB_INGEST_PATH,
                                 DATAHUB_CONFIG["datahubMeta"]["transformLayerName"],
                                 DATAHUB_CONFIG["fileMap"]["ingest"]["etfPrices"]
                                 ])
+filepath_etf_prices_store = "/".join([DATAHUB_INGEST_PATH,
+                                      DATAHUB_CONFIG["datahubMeta"]["datahubStocksName"],
+                                      DATAHUB_CONFIG["datahubMeta"]["transformLayerName"],
+                                      DATAHUB_CONFIG["fileMap"]["ingest"]["etfPricesStore"]
+                                      ])
 filepath_crypto_prices = "/".join([DATAHUB_INGEST_PATH,
                                    DATAHUB_CONFIG["datahubMeta"]["datahubCryptoName"],
                                    DATAHUB_CONFIG["datahubMeta"]["transformLayerName"],
                                    DATAHUB_CONFIG["fileMap"]["ingest"]["cryptoPrices"]
                                    ])
+filepath_crypto_prices_store = "/".join([DATAHUB_INGEST_PATH,
+                                         DATAHUB_CONFIG["datahubMeta"]["datahubCryptoName"],
+                                         DATAHUB_CONFIG["datahubMeta"]["transformLayerName"],
+                                         DATAHUB_CONFIG["fileMap"]["ingest"]["cryptoPricesStore"]
+                                         ])
+filepath_fx_rates = "/".join([DATAHUB_INGEST_PATH,
+                              DATAHUB_CONFIG["datahubMeta"]["datahubFxName"],
+                              DATAHUB_CONFIG["datahubMeta"]["transformLayerName"],
+                              DATAHUB_CONFIG["fileMap"]["ingest"]["fxRates"]
+                              ])
+FX_RATES = FxRates(filepath_fx_rates,
+                   cache=HTTP_CACHE,
+                   ttl=CACHE_TTL["conversionRates"],
+                   )
 
 # Load source-data
 df_etf_portfolio = load_data(filepath_portfolio, sheet_name="Buys")
 df_etf_regionMap = load_data(filepath_etf_regionMap)
 list_etf_isin = list(load_data(filepath_etf_list)["ISIN"].dropna().drop_duplicates())
 list_etf_isin_valid = list(df_etf_portfolio["ISIN"].dropna().drop_duplicates())
+list_etf_isin_refresh = get_isins_to_refresh(list_etf_isin,
+                                             filepath_etf_master,
+                                             max_age_days=MASTER_MAX_AGE_DAYS,
+                                             )
 
 # Extract: Stocks Datahub
-df_etf_master = extract_etf_master_data(list_etf_isin,
-                                        source_url=ETF_SOURCE_URL,
-                                        )
-df_etf_prices = extract_etf_price_data(list_etf_isin_valid,
-                                       source_url=ETF_SOURCE_URL,
-                                       )
+(df_etf_master, df_etf_prices) = extract_etf_data(list_etf_isin_refresh,
+                                                 list_etf_isin_valid,
+                                                 source_url=ETF_SOURCE_URL,
+                                                 max_workers=MAX_WORKERS,
+                                                 requests_per_second=REQUESTS_PER_SECOND,
+                                                 parser=HTML_PARSER,
+                                                 cache=HTTP_CACHE,
+                                                 master_ttl=CACHE_TTL["etfMaster"],
+                                                 price_ttl=CACHE_TTL["etfPrices"],
+                                                 )
 
 # TRANSFORM: Stocks Datahub
 transform_etf_master(
     df_etf_master,
     df_etf_regionMap,
     out_path=filepath_etf_master,
+    incremental=True,
+    isin_list=list_etf_isin,
 )
 transform_historization_etf_prices(
     df_etf_prices,
-    out_path=filepath_etf_prices,
+    out_path=filepath_etf_prices_store,
+    legacy_csv_path=filepath_etf_prices,
 )
 
 # Extract & Transform: Crypto Datahub
-df_crypto_prices=extract_crypto_prices()
+df_crypto_prices=extract_crypto_prices(max_workers=MAX_WORKERS,
+                                       requests_per_second=REQUESTS_PER_SECOND,
+                                       cache=HTTP_CACHE,
+                                       ttl=CACHE_TTL["cryptoPrices"],
+                                       )
 transform_crypto_prices(df_prices=df_crypto_prices,
                         out_path=filepath_crypto_prices,
+                        history_path=filepath_crypto_prices_store,
+                        fx_rates=FX_RATES,
                         )